@@ -15,10 +15,19 @@
 # limitations under the License.
 
 import collections
+from concurrent import futures
+import io
 import json
 import os
+import pickle
 import sys
 
+try:
+    import orjson
+    _json_loads = orjson.loads
+except ImportError:
+    _json_loads = json.loads
+
 from cc.api_assembly import CcApiAssemblyContext
 from java.api_assembly import JavaApiAssemblyContext
 from build_file_generator import BuildFileGenerator
@@ -27,96 +36,218 @@ import ninja_tools
 ContributionData = collections.namedtuple("ContributionData",
                                           ("inner_tree", "json_data"))
 
+# Top-level keys that every API contribution file must have.
+_REQUIRED_KEYS = ("name", "version", "api_domain")
+
+
+class ContributionError(Exception):
+    """Malformed API contribution file."""
+
 
 def assemble_apis(context, inner_trees):
     # Find all of the contributions from the inner tree
     contribution_files_dict = inner_trees.for_each_tree(
         api_contribution_files_for_inner_tree)
 
-    # Load and validate the contribution files
-    # TODO: Check timestamps and skip unnecessary work
+    # Load and validate the contribution files.  Files that have not changed
+    # since the last run are taken from the cache.
+    cache_file = context.out.api_surfaces_work_dir("contrib_cache.pkl")
+    contribution_cache = load_contribution_cache(cache_file)
+    contribution_files = [(tree_key, entry)
+                          for tree_key, entries in contribution_files_dict.items()
+                          for entry in entries]
     contributions = []
-    for tree_key, filenames in contribution_files_dict.items():
-        for filename in filenames:
-            json_data = load_contribution_file(context, filename)
-            if not json_data:
-                continue
-            # TODO: Validate the configs, especially that the domains match what we asked for
-            # from the lunch config.
-            contributions.append(
-                ContributionData(inner_trees.get(tree_key), json_data))
+    for (tree_key, entry), json_data in zip(
+            contribution_files,
+            load_contribution_files(context,
+                                    [x[1] for x in contribution_files],
+                                    contribution_cache)):
+        if not json_data:
+            continue
+        # TODO: Validate the configs, especially that the domains match what we asked for
+        # from the lunch config.
+        contributions.append(
+            ContributionData(inner_trees.get(tree_key), json_data))
 
     # Group contributions by language and API surface
     stub_libraries = collate_contributions(contributions)
 
     # Initialize the build file writer
-    build_file_generator = BuildFileGenerator()
+    build_file_generator = BuildFileGenerator(
+        context.out.api_surfaces_work_dir("android_bp_manifest.json"))
 
-    # Initialize the ninja file writer
-    with open(context.out.api_ninja_file(), "w",
-              encoding='iso-8859-1') as ninja_file:
-        ninja = ninja_tools.Ninja(context, ninja_file)
-
-        # Iterate through all of the stub libraries and generate rules to assemble them
-        # and Android.bp/BUILD files to make those available to inner trees.
-        # TODO: Parallelize? Skip unnecessary work?
-        for stub_library in stub_libraries:
-            # TODO (b/265962882): Export APIs of version < current.
-            # API files of older versions (29,30,...) are currently not
-            # available in out/api_surfaces.
-            # This cause isssues during CC API import, since Soong
-            # cannot resolve the dependency for rdeps that specify
-            # `sdk_version:<num>`.
-            # Create a short-term hack that unconditionally generates Soong
-            # modules for all NDK libraries, starting from version=1.
-            # This does not compromise on API correctness though, since the correct
-            # version number will be passed to the ndkstubgen invocation.
-            # TODO(b/266830850): Revisit stubs versioning for Module-lib API
-            # surface.
-            if stub_library.language == "cc_libraries" and stub_library.api_surface in ["publicapi", "module-libapi"]:
-                versions = list(range(1,34)) # 34 is current
-                versions.append("current")
-                for version in versions:
-                    stub_library.api_surface_version = str(version)
-                    STUB_LANGUAGE_HANDLERS[stub_library.language](
-                        context, ninja, build_file_generator, stub_library)
-            else:
-                STUB_LANGUAGE_HANDLERS[stub_library.language](context, ninja,
+    # Initialize the ninja file writer.  The rules are generated into memory,
+    # and the ninja file is only opened once they are all known.
+    ninja_buffer = io.StringIO()
+    ninja = ninja_tools.Ninja(context, ninja_buffer)
+
+    # Iterate through all of the stub libraries and generate rules to assemble them
+    # and Android.bp/BUILD files to make those available to inner trees.
+    # TODO: Parallelize? Skip unnecessary work?
+    for stub_library in stub_libraries:
+        # TODO (b/265962882): Export APIs of version < current.
+        # API files of older versions (29,30,...) are currently not
+        # available in out/api_surfaces.
+        # This cause isssues during CC API import, since Soong
+        # cannot resolve the dependency for rdeps that specify
+        # `sdk_version:<num>`.
+        # Create a short-term hack that unconditionally generates Soong
+        # modules for all NDK libraries, starting from version=1.
+        # This does not compromise on API correctness though, since the correct
+        # version number will be passed to the ndkstubgen invocation.
+        # TODO(b/266830850): Revisit stubs versioning for Module-lib API
+        # surface.
+        if stub_library.language == "cc_libraries" and stub_library.api_surface in ["publicapi", "module-libapi"]:
+            versions = [str(x) for x in range(1, 34)]  # 34 is current
+            versions.append("current")
+            STUB_LANGUAGE_HANDLERS[stub_library.language](
+                context,
+                ninja,
+                build_file_generator,
+                stub_library,
+                versions=versions)
+        else:
+            STUB_LANGUAGE_HANDLERS[stub_library.language](context, ninja,
                                                           build_file_generator,
                                                           stub_library)
 
-        # TODO: Handle host_executables separately or as a StubLibrary language?
+    # TODO: Handle host_executables separately or as a StubLibrary language?
 
-        # Finish writing the ninja file
-        ninja.write()
+    # Finish writing the ninja file
+    ninja.write()
+    with open(context.out.api_ninja_file(), "w",
+              encoding='iso-8859-1') as ninja_file:
+        ninja_file.write(ninja_buffer.getvalue())
 
     build_file_generator.write()
     build_file_generator.clean(
         context.out.api_surfaces_dir())  # delete stale Android.bp files
 
+    save_contribution_cache(cache_file, contribution_cache)
+
 
 def api_contribution_files_for_inner_tree(tree_key, inner_tree, cookie):
-    "Scan an inner_tree's out dir for the api contribution files."
+    """Scan an inner_tree's out dir for the api contribution files.
+
+    Returns a list of os.DirEntry objects, so that the stat results are
+    available to the contribution cache without another syscall.
+    """
     directory = inner_tree.out.api_contributions_dir()
     result = []
     with os.scandir(directory) as it:
         for dirent in it:
-            if not dirent.is_file():
-                break
-            if dirent.name.endswith(".json"):
-                result.append(os.path.join(directory, dirent.name))
+            # Check the name first: it never needs a stat call.  Inner trees
+            # may symlink their contribution files, so follow symlinks; only
+            # those cost a stat.
+            if (dirent.name.endswith(".json")
+                    and dirent.is_file()):
+                result.append(dirent)
     return result
 
 
+def load_contribution_cache(filename):
+    """Return the contribution cache saved in filename, or an empty cache."""
+    try:
+        with open(filename, "rb") as f:
+            cache = pickle.load(f)
+    except FileNotFoundError:
+        return {}
+    except Exception as ex:  # pylint: disable=broad-except
+        # The cache is only an optimization: a truncated or stale pickle can
+        # fail in many ways, and any of them just means a cold read.
+        print(f"Ignoring contribution cache {filename}: {ex!r}",
+              file=sys.stderr)
+        return {}
+    return cache if isinstance(cache, dict) else {}
+
+
+def save_contribution_cache(filename, cache):
+    """Save the contribution cache to filename."""
+    os.makedirs(os.path.dirname(filename), exist_ok=True)
+    with open(filename, "wb") as f:
+        pickle.dump(cache, f, protocol=pickle.HIGHEST_PROTOCOL)
+
+
+def _contribution_cache_key(entry):
+    """The contribution cache key for the os.DirEntry entry."""
+    st = entry.stat()
+    return (entry.path, st.st_mtime_ns, st.st_size)
+
+
+def load_contribution_files(context, entries, cache=None):
+    """Load the API contributions in entries, returning them in the same order.
+
+    Args:
+      context: Context for global state.
+      entries: The os.DirEntry objects for the contribution files.
+      cache: Optional dict of parsed contributions keyed by (path, mtime_ns,
+             size).  It is updated in place to hold exactly the entries.
+
+    Files missing from the cache are read concurrently, since this is mostly
+    waiting on I/O.
+    """
+    if cache is None:
+        cache = {}
+    keys = [_contribution_cache_key(x) for x in entries]
+    missing = [x for x in keys if x not in cache]
+    if missing:
+        with futures.ThreadPoolExecutor(
+                max_workers=min(32, len(missing))) as executor:
+            results = executor.map(_read_contribution_file,
+                                   [x[0] for x in missing])
+            for key, result in zip(missing, results):
+                cache[key] = _check_contribution(context, key[0], result)
+
+    # Drop the entries for files that have changed or gone away.
+    wanted = set(keys)
+    for key in [x for x in cache if x not in wanted]:
+        del cache[key]
+    return [cache[x] for x in keys]
+
+
 def load_contribution_file(context, filename):
     "Load and return the API contribution at filename. On error report error and return None."
-    with open(filename, encoding='iso-8859-1') as f:
+    return _check_contribution(context, filename,
+                               _read_contribution_file(filename))
+
+
+def _read_contribution_file(filename):
+    """Return the parsed contents of filename, or the error.
+
+    Errors are returned rather than raised so that they can be reported from
+    the calling thread.  orjson is used when available; its JSONDecodeError
+    is a subclass of the stdlib one.
+
+    The top-level structure is checked here, once per file, so that callers
+    can index the required keys directly.
+    """
+    with open(filename, "rb") as f:
         try:
-            return json.load(f)
+            json_data = _json_loads(f.read())
         except json.decoder.JSONDecodeError as ex:
-            # TODO: Error reporting
-            context.errors.error(ex.msg, filename, ex.lineno, ex.colno)
-            raise ex
+            return ex
+    if not json_data:
+        # Empty contributions are skipped by the caller.
+        return json_data
+    if not isinstance(json_data, dict):
+        return ContributionError("Malformed API contribution")
+    missing = [x for x in _REQUIRED_KEYS if x not in json_data]
+    if missing:
+        return ContributionError(
+            f"Missing keys in API contribution: {', '.join(missing)}")
+    return json_data
+
+
+def _check_contribution(context, filename, result):
+    """Report any error returned by _read_contribution_file."""
+    if isinstance(result, json.decoder.JSONDecodeError):
+        # TODO: Error reporting
+        context.errors.error(result.msg, filename, result.lineno, result.colno)
+        raise result
+    if isinstance(result, ContributionError):
+        context.errors.error(str(result), filename)
+        raise result
+    return result
 
 
 class StubLibraryContribution(object):
@@ -146,20 +277,24 @@ def collate_contributions(contributions):
     """
     grouped = {}
     for contribution in contributions:
-        for language in STUB_LANGUAGE_HANDLERS.keys():
-            for library in contribution.json_data.get(language, []):
-                key = (language, contribution.json_data["name"],
-                       contribution.json_data["version"], library["name"])
+        json_data = contribution.json_data
+        surface = json_data["name"]
+        version = json_data["version"]
+        api_domain = json_data["api_domain"]
+        # Preserve the order of STUB_LANGUAGE_HANDLERS.
+        for language in STUB_LANGUAGE_HANDLERS:
+            libraries = json_data.get(language)
+            if not libraries:
+                continue
+            for library in libraries:
+                key = (language, surface, version, library["name"])
                 stub_library = grouped.get(key)
-                if not stub_library:
-                    stub_library = StubLibrary(
-                        language, contribution.json_data["name"],
-                        contribution.json_data["version"], library["name"])
-                    grouped[key] = stub_library
+                if stub_library is None:
+                    stub_library = grouped[key] = StubLibrary(
+                        language, surface, version, library["name"])
                 stub_library.add_contribution(
-                    StubLibraryContribution(
-                        contribution.inner_tree,
-                        contribution.json_data["api_domain"], library))
+                    StubLibraryContribution(contribution.inner_tree,
+                                            api_domain, library))
     return list(grouped.values())
 
 
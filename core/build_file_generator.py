@@ -15,12 +15,14 @@
 # limitations under the License.
 """A module for generating Android.bp/BUILD files for stub libraries"""
 
+from concurrent import futures
 from enum import Enum
+import hashlib
 import json
+from json.encoder import encode_basestring_ascii
 import os
 import textwrap
 from typing import List
-from lunch import walk_paths
 
 TAB = "    "  # 4 spaces
 
@@ -37,30 +39,17 @@ class ConfigAxis(Enum):
         return self != ConfigAxis.NoConfig
 
     @classmethod
-    def get_arch_axes(cls) -> list:
-        return [a for a in cls if a.is_arch_axis()]
+    def get_arch_axes(cls) -> tuple:
+        return _ARCH_AXES
 
     @classmethod
     def get_axis(cls, value):
-        for axis in cls:
-            if axis.value == value:
-                return axis
-        return None
+        return _VALUE_TO_AXIS.get(value)
 
 
-class AndroidBpPropertyKey:
-    """Unique key identifying an Android.bp property."""
-
-    def __init__(self, name: str, axis: str):
-        self.name = name
-        self.axis = axis
-
-    def __hash__(self):
-        return hash((self.name, self.axis))
-
-    def __eq__(self, other):
-        return (isinstance(other, AndroidBpPropertyKey)
-                and self.name == other.name and self.axis == other.axis)
+# These are called for every module and property, so compute them once.
+_ARCH_AXES = tuple(a for a in ConfigAxis if a.is_arch_axis())
+_VALUE_TO_AXIS = {a.value: a for a in ConfigAxis}
 
 
 class AndroidBpProperty:
@@ -104,13 +93,25 @@ class AndroidBpProperty:
         """Converts an object into a list."""
         if not value:
             return []
-        if isinstance(value, (int, bool, str)):
-            return [value]
-        if isinstance(value, list):
-            return value
-        if isinstance(value, (set, tuple)):
-            return list(value)
-        raise TypeError(f"bad type {type(value)}")
+        convert = _AS_LIST.get(type(value))
+        if convert is None:
+            raise TypeError(f"bad type {type(value)}")
+        return convert(value)
+
+
+def _as_singleton_list(value):
+    return [value]
+
+
+# How AndroidBpProperty._as_list converts each supported type.
+_AS_LIST = {
+    str: _as_singleton_list,
+    int: _as_singleton_list,
+    bool: _as_singleton_list,
+    list: lambda value: value,
+    tuple: list,
+    set: list,
+}
 
 
 class AndroidBpModule:
@@ -123,7 +124,8 @@ class AndroidBpModule:
             raise ValueError("module_type cannot be empty in SoongModule")
         self.name = name
         self.module_type = module_type
-        self.properties = {}  # indexed using AndroidBpPropertyKey
+        # Properties bucketed by axis, and then indexed by name.
+        self.properties = {}
 
     def add_property(self, prop: str, val: object, axis=ConfigAxis.NoConfig):
         """Add a property to the Android.bp module.
@@ -131,27 +133,26 @@ class AndroidBpModule:
         Raises:
             ValueError if (`prop`, `axis`) is already registered.
         """
-        key = AndroidBpPropertyKey(name=prop, axis=axis)
-        if key in self.properties:
+        props = self.properties.setdefault(axis, {})
+        if prop in props:
             raise ValueError(f"Property: {prop} in axis: {axis} has been"
                              "registered. Use extend_property method instead.")
 
-        p = AndroidBpProperty(prop, val, axis)
-        self.properties[key] = p
+        props[prop] = AndroidBpProperty(prop, val, axis)
 
     def extend_property(self,
                         prop: str,
                         val: object,
                         axis=ConfigAxis.NoConfig):
         """Extend the value of a property."""
-        key = AndroidBpPropertyKey(name=prop, axis=axis)
-        if key in self.properties:
-            self.properties[key].extend(val)
+        p = self.properties.get(axis, {}).get(prop)
+        if p is not None:
+            p.extend(val)
         else:
             self.add_property(prop, val, axis)
 
     def get_properties(self, axis) -> List[AndroidBpProperty]:
-        return [prop for prop in self.properties.values() if prop.axis == axis]
+        return list(self.properties.get(axis, {}).values())
 
     def string(self, formatter=None) -> None:
         """Return the string representation of the module using the provided
@@ -225,25 +226,66 @@ class AndroidBpFile:
 
     def is_stale(self, formatter=None) -> bool:
         """Return true if the object is newer than the file on disk."""
+        return self._is_stale(self.string(formatter))
+
+    def _is_stale(self, content: str) -> bool:
+        """Return true if content differs from the file on disk."""
         exists = os.path.exists(self._path)
         if not exists:
             return True
         with open(self._path, encoding='iso-8859-1') as f:
-            # TODO: Avoid wasteful computation using cache
-            return f.read() != self.string(formatter)
+            return f.read() != content
+
+    def write(self, formatter=None, manifest=None) -> None:
+        """Write the AndroidBpFile object to disk.
 
-    def write(self, formatter=None) -> None:
-        """Write the AndroidBpFile object to disk."""
-        if not self.is_stale(formatter):
+        Args:
+            formatter: The formatter to use.
+            manifest: Optional dict of path -> [digest, mtime_ns, size] for
+                the files that were written previously.  If the file on disk
+                still has the recorded mtime and size, the digest is compared
+                instead of reading the file.  Updated in place.
+        """
+        # Render once: the modules may still be modified after they are added
+        # to the file, so the result is not kept beyond this call.
+        content = self.string(formatter)
+        if manifest is None:
+            if self._is_stale(content):
+                self._write(content)
             return
+
+        digest = _content_digest(content)
+        entry = manifest.get(self._path)
+        try:
+            st = os.stat(self._path)
+        except FileNotFoundError:
+            st = None
+        if st is None:
+            stale = True
+        elif entry and entry[1:] == [st.st_mtime_ns, st.st_size]:
+            stale = entry[0] != digest
+        else:
+            stale = self._is_stale(content)
+        if stale:
+            self._write(content)
+            st = os.stat(self._path)
+        manifest[self._path] = [digest, st.st_mtime_ns, st.st_size]
+
+    def _write(self, content: str) -> None:
         os.makedirs(os.path.dirname(self._path), exist_ok=True)
         with open(self._path, "w+", encoding='iso-8859-1') as f:
-            f.write(self.string(formatter))
+            f.write(content)
 
     def fullpath(self) -> str:
         return self._path
 
 
+def _content_digest(content: str) -> str:
+    """Return the digest of the Android.bp contents."""
+    return hashlib.blake2b(content.encode('iso-8859-1'),
+                           digest_size=16).hexdigest()
+
+
 # Default formatters
 def comment_formatter(comment: AndroidBpComment) -> str:
     return "\n".join(comment.split())
@@ -262,17 +304,7 @@ def module_properties_formatter(props: List[AndroidBpProperty],
         elif isinstance(val, int):
             val_f = val
         elif isinstance(val, list):
-            # TODO: Align with bpfmt.
-            # This implementation splits non-singular lists into multiple lines.
-            if len(val) < 2:
-                val_f = json.dumps(val)
-            else:
-                nested_indent = indent + 1
-                val_f = json.dumps(val, indent=f"{nested_indent*TAB}")
-                # Add TAB before the closing `]`
-                val_f = val_f[:
-                                              -1] + indent * TAB + val_f[
-                                                  -1]
+            val_f = _format_list(val, indent)
         else:
             raise NotImplementedError(
                 f"Formatter for {val} of type: {type(val)}"
@@ -282,6 +314,22 @@ def module_properties_formatter(props: List[AndroidBpProperty],
     return formatted
 
 
+def _format_list(val: list, indent: int) -> str:
+    """Format a list property value the way json.dumps would."""
+    # Lists are almost always all strings: quote them without going through
+    # the generic encoder.
+    if all(isinstance(x, str) for x in val):
+        elements = [encode_basestring_ascii(x) for x in val]
+    else:
+        elements = [json.dumps(x) for x in val]
+    # TODO: Align with bpfmt.
+    # This implementation splits non-singular lists into multiple lines.
+    if len(elements) < 2:
+        return f"[{''.join(elements)}]"
+    nested = ",\n".join(f"{(indent + 1) * TAB}{x}" for x in elements)
+    return f"[\n{nested}\n{indent * TAB}]"
+
+
 def module_formatter(module: AndroidBpModule) -> str:
     formatted = textwrap.dedent(f"""\
             {module.module_type} {{
@@ -292,8 +340,7 @@ def module_formatter(module: AndroidBpModule) -> str:
     formatted += module_properties_formatter(no_arch_props)
 
     # Print the arch props if they exist.
-    contains_arch_props = any(
-        [prop.axis.is_arch_axis() for prop in module.properties])
+    contains_arch_props = any(axis.is_arch_axis() for axis in module.properties)
     if contains_arch_props:
         formatted += f"{TAB}arch: {{\n"
         arch_axes = ConfigAxis.get_arch_axes()
@@ -322,9 +369,28 @@ class BazelBuildFile:
 class BuildFileGenerator:
     """Class to maintain state of generated Android.bp/BUILD files."""
 
-    def __init__(self):
+    def __init__(self, manifest_file: str = None):
+        """Initialize the object.
+
+        Args:
+            manifest_file: Optional file recording the digests of the
+                Android.bp files written by the previous run, so that
+                unchanged files do not need to be read back.
+        """
         self.android_bp_files = []
         self.bazel_build_files = []
+        self._manifest_file = manifest_file
+        self._manifest = self._load_manifest()
+
+    def _load_manifest(self) -> dict:
+        if not self._manifest_file:
+            return None
+        try:
+            with open(self._manifest_file, encoding='iso-8859-1') as f:
+                manifest = json.load(f)
+        except (OSError, ValueError):
+            return {}
+        return manifest if isinstance(manifest, dict) else {}
 
     def add_android_bp_file(self, file: AndroidBpFile):
         self.android_bp_files.append(file)
@@ -334,16 +400,61 @@ class BuildFileGenerator:
                                   "is not supported currently")
 
     def write(self):
-        for android_bp_file in self.android_bp_files:
-            android_bp_file.write()
+        # The same file may have been added more than once.  Only write each
+        # path once (the last one added wins, as it would when writing them in
+        # order), so that no two threads write the same file.
+        bp_files = {x.fullpath(): x for x in self.android_bp_files}
+        with futures.ThreadPoolExecutor(
+                max_workers=os.cpu_count()) as executor:
+            # Consume the results so that any exceptions are raised here.
+            list(
+                executor.map(lambda x: x.write(manifest=self._manifest),
+                             bp_files.values()))
+        if self._manifest is None:
+            return
+        valid_bp_files = set(bp_files)
+        manifest = {
+            k: v
+            for k, v in self._manifest.items() if k in valid_bp_files
+        }
+        os.makedirs(os.path.dirname(self._manifest_file), exist_ok=True)
+        with open(self._manifest_file, "w", encoding='iso-8859-1') as f:
+            json.dump(manifest, f)
 
     def clean(self, staging_dir: str):
         """Delete discarded Android.bp files.
 
         This is necessary when a library is dropped from an API surface."""
         valid_bp_files = set([x.fullpath() for x in self.android_bp_files])
-        for bp_file_on_disk in walk_paths(staging_dir,
-                                          lambda x: x.endswith("Android.bp")):
-            if bp_file_on_disk not in valid_bp_files:
+        for entry in _scandir_bp(staging_dir):
+            if entry.path not in valid_bp_files:
                 # This library has been dropped since the last run
-                os.remove(bp_file_on_disk)
+                try:
+                    os.remove(entry.path)
+                except FileNotFoundError:
+                    pass
+
+
+def _scandir_bp(directory: str, ttl=10):
+    """Yield a DirEntry for each Android.bp file under directory.
+
+    Like lunch.walk_paths, this matches names ending in "Android.bp", goes no
+    more than ttl directories deep, and skips entries that cannot be read.
+    """
+    try:
+        it = os.scandir(directory)
+    except OSError:
+        return
+    subdirs = []
+    with it:
+        for entry in it:
+            try:
+                if entry.name.endswith("Android.bp") and entry.is_file():
+                    yield entry
+                elif ttl > 0 and entry.is_dir(follow_symlinks=False):
+                    subdirs.append(entry.path)
+            except OSError:
+                # Consume filesystem errors, e.g. too many links, permission etc.
+                pass
+    for subdir in subdirs:
+        yield from _scandir_bp(subdir, ttl - 1)
@@ -15,7 +15,7 @@
 # limitations under the License.
 
 from collections.abc import Sequence
-from functools import lru_cache
+from functools import lru_cache, partial
 import json
 import os
 from typing import Optional
@@ -42,6 +42,42 @@ _SUPPORTED_API_SURFACES_FOR_IMPORT = {
     "publicapi", "vendorapi", "module-libapi"
 }
 
+# ndkstubgen uses a map for converting Android version codes to a numeric code.
+# e.g. "R" --> 30
+# The map contains active_codenames as well, which get mapped to a preview level
+# (9000+).
+# TODO: Keep this in sync with build/soong/android/api_levels.go.
+_ACTIVE_CODENAMES = ["UpsideDownCake"]
+_PREVIEW_API_LEVEL_BASE = 9000
+_API_LEVELS = {
+    "G": 9,
+    "I": 14,
+    "J": 16,
+    "J-MR1": 17,
+    "J-MR2": 18,
+    "K": 19,
+    "L": 21,
+    "L-MR1": 22,
+    "M": 23,
+    "N": 24,
+    "N-MR1": 25,
+    "O": 26,
+    "O-MR1": 27,
+    "P": 28,
+    "Q": 29,
+    "R": 30,
+    "S": 31,
+    "S-V2": 32,
+    "Tiramisu": 33,
+}
+_API_LEVELS_JSON = json.dumps({
+    **_API_LEVELS,
+    **{
+        codename: _PREVIEW_API_LEVEL_BASE + index
+        for index, codename in enumerate(_ACTIVE_CODENAMES)
+    }
+})
+
 
 class CcApiAssemblyContext(object):
     """Context object for managing global state of CC API Assembly."""
@@ -185,35 +221,121 @@ class CcApiAssemblyContext(object):
             f"API surface {stub_library.api_surface} of library {stub_library.name} is not a recognized API surface."
         )
 
-    def assemble_cc_api_library(self, context, ninja, build_file_generator,
-                                stub_library):
-        staging_dir = context.out.api_library_dir(
-            stub_library.api_surface, stub_library.api_surface_version,
-            stub_library.name)
-        work_dir = context.out.api_library_work_dir(
-            stub_library.api_surface, stub_library.api_surface_version,
-            stub_library.name)
-
-        # Generate Android.bp file for the stub library.
+    def assemble_cc_api_library(self,
+                                context,
+                                ninja,
+                                build_file_generator,
+                                stub_library,
+                                versions=None):
+        """Generate the rules and Android.bp files for a cc stub library.
 
+        Args:
+            context: Context for global state.
+            ninja: Ninja writer object. ninja_tools.Ninja instance.
+            build_file_generator: Container for registering Android.bp files.
+            stub_library: api_assembly.StubLibrary instance.
+            versions: The API surface versions to assemble the library for.
+                Defaults to stub_library.api_surface_version.  The work that
+                does not depend on the version is only done once.
+        """
         # TODO : Handle other API types
         if stub_library.api_surface not in _SUPPORTED_API_SURFACES_FOR_IMPORT:
             return
 
+        if versions is None:
+            versions = [stub_library.api_surface_version]
+
         # TODO : Keep only one cc_api_library per target module
         stub_module = self._api_stub_library_module(context,
                                                     build_file_generator,
                                                     stub_library.name)
 
+        # The headers and the ndkstubgen arguments are the same for every
+        # version.
+        contributions = [(contrib, self._contribution_headers(contrib))
+                         for contrib in stub_library.contributions]
+        extra_args = self._additional_ndkstubgen_args(
+            stub_library.api_surface)
+
+        for version in versions:
+            stub_library.api_surface_version = str(version)
+            self._assemble_cc_api_library_version(context, ninja,
+                                                  build_file_generator,
+                                                  stub_library, stub_module,
+                                                  contributions, extra_args)
+
+        # Generate rules to build the API levels map.
+        if not self._api_levels_file_added:
+            self._add_api_levels_file(context, ninja)
+            self._api_levels_file_added = True
+
+    def _contribution_headers(self, contrib):
+        """Return the headers of a contribution.
+
+        Returns:
+            A list of (headers, relpaths, srcs) tuples, one per header module
+            in the contribution.  relpaths are the paths of the headers
+            relative to their include dir, and srcs are the paths of the same
+            headers in the outer tree.
+        """
+        # Local aliases for the per-header loops below.
+        join = os.path.join
+        normpath = os.path.normpath
+        relpath = os.path.relpath
+        tree_root = contrib.inner_tree.root
+        result = []
+        for headers in contrib.library_contribution["headers"]:
+            root = headers["root"]
+            files = headers["headers"]
+            # Remove the root from the full filepath.
+            # e.g. bionic/libc/include/stdio.h --> stdio.h
+            # The headers are normally under root, so strip the prefix rather
+            # than paying for os.path.relpath on every file.  That is only the
+            # same as relpath when the rest of the path is already normalized.
+            root_prefix = join(root, "")
+            root_len = len(root_prefix)
+            relpaths = []
+            for file in files:
+                rest = file[root_len:]
+                if (file.startswith(root_prefix) and not rest.startswith("/")
+                        and normpath(rest) == rest):
+                    relpaths.append(rest)
+                else:
+                    relpaths.append(relpath(file, root))
+            srcs = [join(tree_root, file) for file in files]
+            result.append((headers, relpaths, srcs))
+        return result
+
+    def _assemble_cc_api_library_version(self, context, ninja,
+                                         build_file_generator, stub_library,
+                                         stub_module, contributions,
+                                         extra_args):
+        """Generate the rules for stub_library.api_surface_version."""
+        staging_dir = context.out.api_library_dir(
+            stub_library.api_surface, stub_library.api_surface_version,
+            stub_library.name)
+        work_dir = context.out.api_library_work_dir(
+            stub_library.api_surface, stub_library.api_surface_version,
+            stub_library.name)
+
+        # Generate Android.bp file for the stub library.
         stub_variant = self._api_stub_variant_module(context,
                                                      build_file_generator,
                                                      stub_library, stub_module)
 
+        # The ndkstubgen inputs only differ by arch and api file.
+        make_inputs = partial(GenCcStubsInput,
+                              version=stub_library.api_surface_version,
+                              version_map=self._api_levels_file(context),
+                              additional_args=extra_args)
+
         # Generate rules to copy headers.
+        join = os.path.join
+        add_copy_file = ninja.add_copy_file
         api_deps = []
         system_headers = False
-        for contrib in stub_library.contributions:
-            for headers in contrib.library_contribution["headers"]:
+        for contrib, contrib_headers in contributions:
+            for headers, relpaths, srcs in contrib_headers:
                 # Each header module gets its own include dir.
                 # TODO: Improve the readability of the generated out/ directory.
                 export_include_dir = headers["name"]
@@ -249,18 +371,13 @@ class CcApiAssemblyContext(object):
                 # TODO : Set "export_headers_as_system" if it is defined from original library
                 if headers["system"]:
                     system_headers = True
-                root = headers["root"]
-
-                for file in headers["headers"]:
-                    # TODO: Deal with collisions of the same name from multiple
-                    # contributions.
-                    # Remove the root from the full filepath.
-                    # e.g. bionic/libc/include/stdio.h --> stdio.h
-                    relpath = os.path.relpath(file, root)
-                    include = os.path.join(include_dir, relpath)
-                    ninja.add_copy_file(
-                        include, os.path.join(contrib.inner_tree.root, file))
-                    api_deps.append(include)
+
+                # TODO: Deal with collisions of the same name from multiple
+                # contributions.
+                includes = [join(include_dir, x) for x in relpaths]
+                for include, src in zip(includes, srcs):
+                    add_copy_file(include, src)
+                api_deps.extend(includes)
 
             api = contrib.library_contribution["api"]
             api_out = os.path.join(staging_dir, os.path.basename(api))
@@ -269,16 +386,8 @@ class CcApiAssemblyContext(object):
             api_deps.append(api_out)
 
             # Generate rules to run ndkstubgen.
-            extra_args = self._additional_ndkstubgen_args(
-                stub_library.api_surface)
             for arch in ARCHES:
-                inputs = GenCcStubsInput(
-                    arch=arch,
-                    version=stub_library.api_surface_version,
-                    version_map=self._api_levels_file(context),
-                    api=api_out,
-                    additional_args=extra_args,
-                )
+                inputs = make_inputs(arch=arch, api=api_out)
                 # Generate stub.c files for each arch.
                 stub_outputs = self._stub_generator.add_stubgen_action(
                     ninja, inputs, work_dir)
@@ -363,11 +472,6 @@ class CcApiAssemblyContext(object):
         stub_variant.add_property("export_headers_as_system",
                                   val=system_headers)
 
-        # Generate rules to build the API levels map.
-        if not self._api_levels_file_added:
-            self._add_api_levels_file(context, ninja)
-            self._api_levels_file_added = True
-
         # Generate phony rule to build the library.
         # TODO: This name probably conflictgs with something.
         phony = "-".join([
@@ -398,39 +502,8 @@ class CcApiAssemblyContext(object):
         return ""
 
     def _add_api_levels_file(self, context, ninja):
-        # ndkstubgen uses a map for converting Android version codes to a
-        # numeric code. e.g. "R" --> 30
-        # The map contains active_codenames as well, which get mapped to a preview level
-        # (9000+).
-        # TODO: Keep this in sync with build/soong/android/api_levels.go.
-        active_codenames = ["UpsideDownCake"]
-        preview_api_level_base = 9000
-        api_levels = {
-            "G": 9,
-            "I": 14,
-            "J": 16,
-            "J-MR1": 17,
-            "J-MR2": 18,
-            "K": 19,
-            "L": 21,
-            "L-MR1": 22,
-            "M": 23,
-            "N": 24,
-            "N-MR1": 25,
-            "O": 26,
-            "O-MR1": 27,
-            "P": 28,
-            "Q": 29,
-            "R": 30,
-            "S": 31,
-            "S-V2": 32,
-            "Tiramisu": 33,
-        }
-        for index, codename in enumerate(active_codenames):
-            api_levels[codename] = preview_api_level_base + index
-
         file = self._api_levels_file(context)
-        ninja.add_write_file(file, json.dumps(api_levels))
+        ninja.add_write_file(file, _API_LEVELS_JSON)
 
     def _api_levels_file(self, context) -> str:
         """Returns a path in to generated api_levels map in the intermediates directory.
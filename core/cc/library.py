@@ -19,10 +19,11 @@
 from ninja_tools import Ninja
 from ninja_syntax import BuildAction, Rule
 
-from functools import lru_cache
 from typing import List
+import weakref
 
 class CompileContext():
+    __slots__ = ("src", "flags", "out", "frontend")
 
     def __init__(self, src: str, flags:str, out: str, frontend: str):
         self.src = src
@@ -32,12 +33,18 @@ class CompileContext():
 
 class Compiler():
 
-    @lru_cache(maxsize=None)
+    # The compile rule added to each ninja file, shared by all compilers,
+    # without keeping the ninja file alive.
+    _rules = weakref.WeakKeyDictionary()
+
     def _create_compile_rule(self, ninja: Ninja) -> Rule:
-        rule = Rule("cc")
-        rule.add_variable("description", "compile source to object file using clang/clang++")
-        rule.add_variable("command", "${cFrontend} -c ${cFlags} -o ${out} ${in}")
-        ninja.add_rule(rule)
+        rule = self._rules.get(ninja)
+        if rule is None:
+            rule = Rule("cc")
+            rule.add_variable("description", "compile source to object file using clang/clang++")
+            rule.add_variable("command", "${cFrontend} -c ${cFlags} -o ${out} ${in}")
+            ninja.add_rule(rule)
+            self._rules[ninja] = rule
         return rule
 
     def compile(self, ninja: Ninja, compile_context: CompileContext) -> None:
@@ -53,6 +60,7 @@ class Compiler():
         ninja.add_build_action(compile_action)
 
 class LinkContext():
+    __slots__ = ("objs", "flags", "out", "frontend", "implicits")
 
     def __init__(self, objs: List[str], flags: str, out: str, frontend: str):
         self.objs = objs
@@ -66,12 +74,18 @@ class LinkContext():
 
 class Linker():
 
-    @lru_cache(maxsize=None)
+    # The link rule added to each ninja file, shared by all linkers, without
+    # keeping the ninja file alive.
+    _rules = weakref.WeakKeyDictionary()
+
     def _create_link_rule(self, ninja: Ninja) -> Rule:
-        rule = Rule("ld")
-        rule.add_variable("description", "link object files using clang/clang++")
-        rule.add_variable("command", "${ldFrontend} ${ldFlags} -o ${out} ${in}")
-        ninja.add_rule(rule)
+        rule = self._rules.get(ninja)
+        if rule is None:
+            rule = Rule("ld")
+            rule.add_variable("description", "link object files using clang/clang++")
+            rule.add_variable("command", "${ldFrontend} ${ldFlags} -o ${out} ${in}")
+            ninja.add_rule(rule)
+            self._rules[ninja] = rule
         return rule
 
     def link(self, ninja: Ninja, link_context: LinkContext) -> None:
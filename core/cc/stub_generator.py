@@ -27,6 +27,7 @@ from ninja_syntax import Variable, Rule, BuildAction
 NDKSTUBGEN = "orchestrator/build/orchestrator/core/cc/ndkstubgen_runner.sh"
 
 class GenCcStubsInput:
+    __slots__ = ("arch", "version", "version_map", "api", "additional_args")
 
     def __init__(self, arch: str, version: str, api: str, version_map: str, additional_args=""):
         self.arch = arch  # target device arch (e.g. x86)
@@ -72,11 +73,11 @@ class StubGenerator:
         if not self._stubgen_rule:
             self._add_stubgen_rule(ninja)
 
+        arch_dir = os.path.join(work_dir, stub_input.arch)
         outputs = GenCcStubsOutput(
-            stub=os.path.join(work_dir, stub_input.arch, "stub.c"),
-            version_script=os.path.join(work_dir, stub_input.arch, "stub.map"),
-            symbol_list=os.path.join(work_dir, stub_input.arch,
-                                     "abi_symbol_list.txt")
+            stub=f"{arch_dir}/stub.c",
+            version_script=f"{arch_dir}/stub.map",
+            symbol_list=f"{arch_dir}/abi_symbol_list.txt"
         )
 
         # Create the ninja build action.
@@ -0,0 +1,53 @@
+#!/usr/bin/env python
+#
+# Copyright (C) 2023 The Android Open Source Project
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""Unit tests for api_assembly.py."""
+
+from types import SimpleNamespace
+import unittest
+
+from cc.api_assembly import CcApiAssemblyContext
+
+
+class TestContributionHeaders(unittest.TestCase):
+
+    def relpaths(self, root, files):
+        contrib = SimpleNamespace(
+            inner_tree=SimpleNamespace(root="tree"),
+            library_contribution={
+                "headers": [{"root": root, "headers": files}]
+            })
+        result = CcApiAssemblyContext()._contribution_headers(contrib)
+        self.assertEqual(len(result), 1)
+        return result[0][1]
+
+    def test_under_root(self):
+        self.assertEqual(self.relpaths("include", ["include/a/b.h"]),
+                         ["a/b.h"])
+
+    def test_outside_root(self):
+        self.assertEqual(self.relpaths("include", ["other/b.h"]),
+                         ["../other/b.h"])
+
+    def test_dot_component(self):
+        self.assertEqual(self.relpaths("include", ["include/./c.h"]), ["c.h"])
+
+    def test_double_slash(self):
+        self.assertEqual(self.relpaths("include", ["include//x.h"]), ["x.h"])
+
+
+if __name__ == "__main__":
+    unittest.main()
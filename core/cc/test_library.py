@@ -19,7 +19,7 @@
 import unittest
 
 from ninja_tools import Ninja
-from ninja_syntax import Rule, BuildAction
+from ninja_syntax import Rule
 
 from cc.library import CompileContext, Compiler, LinkContext, Linker
 from utils import ContextTest
@@ -34,7 +34,7 @@ class TestCompiler(unittest.TestCase):
         compile_context = CompileContext("src", "flags", "out", frontend="my/clang")
         ninja = Ninja(context=self.ninja_context, file=None)
         compiler.compile(ninja, compile_context)
-        compile_action_nodes = [node for node in ninja.nodes if isinstance(node, BuildAction)]
+        compile_action_nodes = ninja.build_actions
         self.assertTrue(all(["my/clang" in node.implicits for node in compile_action_nodes]))
 
     def test_compile_flags_are_added(self):
@@ -42,7 +42,7 @@ class TestCompiler(unittest.TestCase):
         compile_context = CompileContext("src", "myflag1 myflag2 myflag3", "out", frontend="my/clang")
         ninja = Ninja(context=self.ninja_context, file=None)
         compiler.compile(ninja, compile_context)
-        compile_action_nodes = [node for node in ninja.nodes if isinstance(node, BuildAction)]
+        compile_action_nodes = ninja.build_actions
         self.assertEqual(len(compile_action_nodes), 1)
         compile_action_node = compile_action_nodes[0]
         variables = sorted(compile_action_node.variables, key=lambda x: x.name)
@@ -52,6 +52,15 @@ class TestCompiler(unittest.TestCase):
         self.assertEqual(variables[1].name, "cFrontend")
         self.assertEqual(variables[1].value, compile_context.frontend)
 
+    def test_rule_is_shared(self):
+        ninja = Ninja(context=self.ninja_context, file=None)
+        for out in ("out1", "out2"):
+            Compiler().compile(
+                ninja, CompileContext("src", "flags", out, frontend="my/clang"))
+        rules = [node for node in ninja.nodes if isinstance(node, Rule)]
+        self.assertEqual(len(rules), 1)
+        self.assertEqual(len(ninja.build_actions), 2)
+
 class TestLinker(unittest.TestCase):
 
     def setUp(self):
@@ -62,7 +71,7 @@ class TestLinker(unittest.TestCase):
         link_context = LinkContext("objs", "flags", "out", frontend="my/clang")
         ninja = Ninja(context=self.ninja_context, file=None)
         linker.link(ninja, link_context)
-        link_action_nodes = [node for node in ninja.nodes if isinstance(node, BuildAction)]
+        link_action_nodes = ninja.build_actions
         self.assertTrue(all(["my/clang" in node.implicits for node in link_action_nodes]))
 
     def test_link_flags_are_added(self):
@@ -70,7 +79,7 @@ class TestLinker(unittest.TestCase):
         link_context = LinkContext("src", "myflag1 myflag2 myflag3", "out", frontend="my/clang")
         ninja = Ninja(context=self.ninja_context, file=None)
         linker.link(ninja, link_context)
-        link_action_nodes = [node for node in ninja.nodes if isinstance(node, BuildAction)]
+        link_action_nodes = ninja.build_actions
         self.assertEqual(len(link_action_nodes), 1)
         link_action_node = link_action_nodes[0]
         variables = sorted(link_action_node.variables, key=lambda x: x.name)
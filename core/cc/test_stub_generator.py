@@ -22,7 +22,7 @@ import os
 import sys
 
 from ninja_tools import Ninja
-from ninja_syntax import Variable, BuildAction
+from ninja_syntax import Variable
 from cc.stub_generator import StubGenerator, GenCcStubsInput, NDKSTUBGEN
 from utils import ContextTest
 
@@ -43,8 +43,7 @@ class TestStubGenerator(unittest.TestCase):
         ninja = Ninja(context=self.ninja_context, file=None)
         stub_generator = StubGenerator()
         stub_generator.add_stubgen_action(ninja, self._get_stub_inputs(), "out")
-        build_actions = [node for node in ninja.nodes if isinstance(node,
-                                                                    BuildAction)]
+        build_actions = ninja.build_actions
         self.assertIsNotNone(build_actions)
         self.assertTrue(all([NDKSTUBGEN in x.implicits for x in build_actions]))
         self.assertTrue(["api_levels.json" in x.implicits for x in build_actions])
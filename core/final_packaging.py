@@ -13,6 +13,7 @@
 # See the License for the specific language governing permissions and
 # limitations under the License.
 
+import io
 import json
 import os
 import sys
@@ -24,30 +25,34 @@ import ninja_syntax  # Has to be after ninja_tools because of the path hack
 def final_packaging(context, inner_trees):
     """Pull together all of the previously defined rules into the final build stems."""
 
-    with open(context.out.outer_ninja_file(), "w",
-              encoding='iso-8859-1') as ninja_file:
-        ninja = ninja_tools.Ninja(context, ninja_file)
+    # Generate the rules into memory, and only open the ninja file once they
+    # are all known.
+    ninja_buffer = io.StringIO()
+    ninja = ninja_tools.Ninja(context, ninja_buffer)
 
-        # Add the api surfaces file
-        ninja.add_subninja(
-            ninja_syntax.Subninja(
-                context.out.api_ninja_file(base=context.out.Base.OUTER)))
+    # Add the api surfaces file
+    ninja.add_subninja(
+        ninja_syntax.Subninja(
+            context.out.api_ninja_file(base=context.out.Base.OUTER)))
 
-        # For each inner tree
-        for tree in inner_trees.keys():
-            # TODO: Verify that inner_tree.ninja was generated
+    # For each inner tree
+    for tree in inner_trees.keys():
+        # TODO: Verify that inner_tree.ninja was generated
 
-            # Read and verify file
-            build_targets = read_build_targets_json(context, tree)
-            if not build_targets:
-                continue
+        # Read and verify file
+        build_targets = read_build_targets_json(context, tree)
+        if not build_targets:
+            continue
 
-            # Generate the ninja and build files for this inner tree
-            generate_cross_domain_build_rules(context, ninja, tree,
-                                              build_targets)
+        # Generate the ninja and build files for this inner tree
+        generate_cross_domain_build_rules(context, ninja, tree,
+                                          build_targets)
 
-        # Finish writing the ninja file
-        ninja.write()
+    # Finish writing the ninja file
+    ninja.write()
+    with open(context.out.outer_ninja_file(), "w",
+              encoding='iso-8859-1') as ninja_file:
+        ninja_file.write(ninja_buffer.getvalue())
 
 
 def read_build_targets_json(context, tree):
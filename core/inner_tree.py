@@ -14,18 +14,69 @@
 # See the License for the specific language governing permissions and
 # limitations under the License.
 
+from concurrent import futures
 import enum
+import functools
 import json
 import os
 import subprocess
 import sys
 import textwrap
+import threading
 
 import nsjail
+import utils
 
 _INNER_BUILD = ".inner_build"
 
+# Per-thread state: the _TreeRun of the for_each_tree call that the thread is
+# working on, if any.  It is only set for the duration of one call of func.
+_thread_state = threading.local()
 
+
+class _TreeRun(object):
+    """The inner_build processes started by one concurrent for_each_tree.
+
+    Once stop() is called, the running processes are terminated, and so is
+    any process that is added later.
+    """
+    __slots__ = ("_lock", "_running", "_stopped")
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._running = set()
+        self._stopped = False
+
+    def add(self, process):
+        with self._lock:
+            self._running.add(process)
+            if self._stopped:
+                process.terminate()
+
+    def discard(self, process):
+        with self._lock:
+            self._running.discard(process)
+
+    def stop(self):
+        with self._lock:
+            self._stopped = True
+            for process in self._running:
+                process.terminate()
+
+
+def _is_missing_or_empty_dir(path):
+    """Return whether path is not a directory, or is an empty one.
+
+    Only the first directory entry is read.
+    """
+    try:
+        with os.scandir(path) as it:
+            return next(it, None) is None
+    except (FileNotFoundError, NotADirectoryError):
+        return True
+
+
+@functools.total_ordering
 class InnerTreeKey(object):
     """Trees are identified uniquely by their root and the TARGET_PRODUCT they will use to build.
     If a single tree uses two different prdoucts, then we won't make assumptions about
@@ -33,63 +84,43 @@ class InnerTreeKey(object):
     TODO: This is true for soong. It's more likely that bazel could do analysis for two
     products at the same time in a single tree, so there's an optimization there to do
     eventually."""
+    __slots__ = ("root", "melds", "product", "_key", "_hash")
 
     def __init__(self, root, product):
         if isinstance(root, list):
-            self.melds = root[1:]
+            self.melds = tuple(root[1:])
             root = root[0]
         else:
-            self.melds = []
+            self.melds = ()
         self.root = root
         self.product = product
+        # Compare by (root, melds, product), with no product sorting first.
+        self._key = (root, self.melds, product is not None, product or "")
+        self._hash = hash(self._key)
 
     def __str__(self):
         return (f"TreeKey(root={enquote(self.root)} "
                 f"product={enquote(self.product)}")
 
     def __hash__(self):
-        return hash((self.root, str(self.melds), self.product))
-
-    def _cmp(self, other):
-        assert isinstance(other, InnerTreeKey)
-        if self.root < other.root:
-            return -1
-        if self.root > other.root:
-            return 1
-        if self.melds < other.melds:
-            return -1
-        if self.melds > other.melds:
-            return 1
-        if self.product == other.product:
-            return 0
-        if self.product is None:
-            return -1
-        if other.product is None:
-            return 1
-        if self.product < other.product:
-            return -1
-        return 1
+        return self._hash
 
     def __eq__(self, other):
-        return self._cmp(other) == 0
-
-    def __ne__(self, other):
-        return self._cmp(other) != 0
+        if not isinstance(other, InnerTreeKey):
+            return NotImplemented
+        return self._key == other._key
 
     def __lt__(self, other):
-        return self._cmp(other) < 0
-
-    def __le__(self, other):
-        return self._cmp(other) <= 0
-
-    def __gt__(self, other):
-        return self._cmp(other) > 0
-
-    def __ge__(self, other):
-        return self._cmp(other) >= 0
+        if not isinstance(other, InnerTreeKey):
+            return NotImplemented
+        return self._key < other._key
 
 
 class InnerTree(object):
+    __slots__ = ("root", "meld_dirs", "product", "variant", "domains",
+                 "context", "env_used", "nsjail", "out_root_origin", "out",
+                 "_meld_config")
+
     def __init__(self, context, paths, product, variant):
         """Initialize with the inner tree root (relative to the workspace root)"""
         if not isinstance(paths, list):
@@ -97,11 +128,13 @@ class InnerTree(object):
         self.root = paths[0]
         self.meld_dirs = paths[1:]
         # TODO: more complete checking (include '../' in the checks, etc.
-        if any(x.startswith(os.path.sep) for x in self.meld_dirs):
-            raise Exception(
-                f"meld directories may not start with {os.path.sep}")
-        if any(x.startswith('=') for x in self.meld_dirs[1:]):
-            raise Exception('only the first meld directory can specify "="')
+        for i, meld_dir in enumerate(self.meld_dirs):
+            if meld_dir.startswith(os.path.sep):
+                raise Exception(
+                    f"meld directories may not start with {os.path.sep}")
+            if i and meld_dir.startswith('='):
+                raise Exception(
+                    'only the first meld directory can specify "="')
 
         self.product = product
         self.variant = variant
@@ -154,7 +187,7 @@ class InnerTree(object):
                            rw=False,
                            mandatory=True)
         # Place OUTDIR at /out
-        os.makedirs(out_root_origin, exist_ok=True)
+        utils.ensure_dir(out_root_origin)
         config.add_mountpt(src=os.path.abspath(out_root_origin),
                            dst=inner_tree_out_path,
                            is_bind=True,
@@ -171,8 +204,8 @@ class InnerTree(object):
         # this dir.
         api_surfaces_inner_tree = os.path.join(inner_tree_out_path,
                                                "api_surfaces")
-        os.makedirs(api_surfaces, exist_ok=True)
-        os.makedirs(api_surfaces_inner_tree, exist_ok=True)
+        utils.ensure_dir(api_surfaces)
+        utils.ensure_dir(api_surfaces_inner_tree)
         config.add_mountpt(src=api_surfaces,
                            dst=api_surfaces_inner_tree,
                            is_bind=True,
@@ -187,16 +220,17 @@ class InnerTree(object):
         # loopback device.
         config.add_option(name="clone_newnet", value="false")
 
-        def _meld_git(shared, src):
-            dst = os.path.join(self.root, src[len(shared) + 1:])
-            abs_dst = os.path.join(inner_tree_src_path, src[len(shared) + 1:])
-            abs_src = os.path.abspath(src)
+        def _meld_git(abs_shared, prefix_len, src):
+            relpath = src[prefix_len:]
+            dst = os.path.join(self.root, relpath)
+            abs_dst = os.path.join(inner_tree_src_path, relpath)
+            abs_src = os.path.join(abs_shared, relpath)
             # Only meld if we have not already mounted something at {dst}, and
             # either the project is missing, or is an empty directory:  nsjail
             # creates empty directories when it mounts the directory.
             if abs_dst in config.mount_points:
                 sys.stderr.write(f'{dst} already mounted, ignoring {src}\n')
-            elif not os.path.isdir(dst) or not os.listdir(dst):
+            elif _is_missing_or_empty_dir(dst):
                 # TODO: For repo workspaces, we need to handle <linkfile/> and
                 # <copyfile/> elements from the manifest.
                 sys.stderr.write(f'melding {src} into {dst}\n')
@@ -213,14 +247,33 @@ class InnerTree(object):
                 print('TODO: handle git submodules case')
                 continue
 
-            # Use os.walk (which uses os.scandir), so that we get recursion
-            # for free.
-            for src, dirs, _ in os.walk(shared):
-                # When repo syncs the workspace, .git is a symlink.
-                if '.git' in dirs or os.path.isdir(os.path.join(src, '.git')):
-                    _meld_git(shared, src)
+            # Walk the directories depth first, in the same order as os.walk,
+            # using the DirEntry type information to avoid extra stat calls.
+            # The walked directories are all under shared, so only resolve
+            # it once.
+            abs_shared = os.path.abspath(shared)
+            prefix_len = len(shared) + 1
+            pending = [shared]
+            while pending:
+                src = pending.pop()
+                is_git = False
+                subdirs = []
+                try:
+                    with os.scandir(src) as it:
+                        for entry in it:
+                            if entry.name == '.git':
+                                # When repo syncs the workspace, .git is a
+                                # symlink.
+                                is_git = is_git or entry.is_dir()
+                            elif entry.is_dir(follow_symlinks=False):
+                                subdirs.append(entry.path)
+                except OSError:
+                    continue
+                if is_git:
                     # Stop recursing.
-                    dirs[:] = []
+                    _meld_git(abs_shared, prefix_len, src)
+                else:
+                    pending.extend(reversed(subdirs))
                 # TODO: determine what other source control systems we need
                 # to detect and support here.
 
@@ -277,7 +330,20 @@ class InnerTree(object):
 
         # Run the command
         print("% " + " ".join(cmd))
-        process = subprocess.run(cmd, shell=False, check=False)
+        run = getattr(_thread_state, "run", None)
+        with subprocess.Popen(cmd, shell=False) as process:
+            if run:
+                run.add(process)
+            try:
+                process.wait()
+            except BaseException:
+                # As subprocess.run does: do not leave the child running.
+                process.kill()
+                process.wait()
+                raise
+            finally:
+                if run:
+                    run.discard(process)
 
         # TODO: Probably want better handling of inner tree failures
         if process.returncode:
@@ -291,6 +357,9 @@ class InnerTrees(object):
     def __init__(self, trees, domains):
         self.trees = trees
         self.domains = domains
+        # The trees are fixed once the lunch config is processed, so sort the
+        # keys once.
+        self._sorted_keys = sorted(trees.keys())
 
     def __str__(self):
         """Return a debugging dump of this object"""
@@ -311,17 +380,46 @@ class InnerTrees(object):
 
     def __iter__(self):
         """Return a generator yielding the sorted inner tree keys."""
-        for key in sorted(self.trees.keys()):
-            yield key
+        yield from self._sorted_keys
 
-    def for_each_tree(self, func, cookie=None):
+    def for_each_tree(self, func, cookie=None, executor=None):
         """Call func for each of the inner trees once for each product that will be built in it.
 
-        The calls will be in a stable order.
+        The calls will be in a stable order.  If executor (a
+        concurrent.futures.Executor) is given, the calls are submitted to it
+        and run concurrently.  A single tree is always called directly.
 
         Return a map of the InnerTreeKey to the return value from func().
         """
-        result = {x: func(x, self.trees[x], cookie) for x in self}
+        if executor is None or len(self.trees) < 2:
+            result = {x: func(x, self.trees[x], cookie) for x in self}
+        else:
+            run = _TreeRun()
+
+            def call(tree_key):
+                _thread_state.run = run
+                try:
+                    return func(tree_key, self.trees[tree_key], cookie)
+                finally:
+                    _thread_state.run = None
+
+            jobs = [(x, executor.submit(call, x)) for x in self]
+            # Stop at the first failure, as the serial loop does, rather than
+            # waiting for the rest of the trees.
+            failed = True
+            try:
+                done, _ = futures.wait([job for _, job in jobs],
+                                       return_when=futures.FIRST_EXCEPTION)
+                for _, job in jobs:
+                    if job in done and job.exception() is not None:
+                        job.result()
+                result = {x: job.result() for x, job in jobs}
+                failed = False
+            finally:
+                if failed:
+                    for _, job in jobs:
+                        job.cancel()
+                    run.stop()
         return result
 
     def get(self, tree_key):
@@ -330,7 +428,7 @@ class InnerTrees(object):
 
     def keys(self):
         """Get the keys for the inner trees in name order."""
-        return [self.trees[k] for k in sorted(self.trees.keys())]
+        return [self.trees[k] for k in self._sorted_keys]
 
 
 @enum.unique
@@ -354,6 +452,8 @@ class OutDirLayout(object):
     """Encapsulates the logic about the layout of the inner tree out directories.
     See also context.OutDir for outer tree out dir contents."""
 
+    __slots__ = ("_bases", "_paths")
+
     # For ease of use.
     Base = OutDirBase
 
@@ -367,11 +467,12 @@ class OutDirLayout(object):
           out_path: Where the inner tree out_dir will be mapped, relative to the
                     inner tree root. Usually "out".
         """
-        self._base = {}
-        self._base[self.Base.ORIGIN] = out_origin
-        self._base[self.Base.OUTER] = os.path.join(tree_root, out_path)
-        self._base[self.Base.INNER] = out_path
-        self._base[self.Base.DEFAULT] = self._base[self.Base.ORIGIN]
+        # The base paths, indexed by OutDirBase value.  DEFAULT is ORIGIN.
+        self._bases = (out_origin, out_origin,
+                       os.path.join(tree_root, out_path), out_path)
+        # Map of (args, base) -> path.  The helpers below are called with a
+        # small, fixed set of arguments.
+        self._paths = {}
 
     def _generate_path(self,
                        *args,
@@ -384,7 +485,13 @@ class OutDirLayout(object):
           base: Which base path to use.
           abspath: return the absolute path.
         """
-        ret = os.path.join(self._base[base], *args)
+        key = (args, base)
+        ret = self._paths.get(key)
+        if ret is None:
+            ret = self._paths[key] = os.path.join(self._bases[base.value],
+                                                  *args)
+        # The absolute path depends on the current directory, so it is not
+        # cached.
         if abspath:
             ret = os.path.abspath(ret)
         return ret
@@ -16,7 +16,15 @@
 import json
 import os
 
-_VALID_KEYS = set(("version", "domain_data"))
+try:
+    import orjson
+    _json_loads = orjson.loads
+except ImportError:
+    _json_loads = json.loads
+
+import utils
+
+_VALID_KEYS = frozenset(("version", "domain_data"))
 
 
 class DescribeError(Exception):
@@ -33,10 +41,17 @@ class DescribeError(Exception):
 
 def interrogate_tree(_tree_key, inner_tree, _cookie):
     """Interrogate the inner tree."""
-    query = dict(build_domains=[inner_tree.build_domains])
-    os.makedirs(os.path.dirname(inner_tree.out.tree_query()), exist_ok=True)
-    with open(inner_tree.out.tree_query(), 'w', encoding="iso-8859-1") as f:
-        f.write(json.dumps(query))
+    query = dict(build_domains=inner_tree.build_domains)
+    utils.ensure_dir(os.path.dirname(inner_tree.out.tree_query()))
+    # The query is tiny: write it with a single unbuffered write.
+    data = json.dumps(query, separators=(",", ":")).encode("iso-8859-1")
+    fd = os.open(inner_tree.out.tree_query(),
+                 os.O_WRONLY | os.O_CREAT | os.O_TRUNC, 0o644)
+    try:
+        while data:
+            data = data[os.write(fd, data):]
+    finally:
+        os.close(fd)
     inner_tree.invoke([
         "describe", "--input_json",
         inner_tree.out.tree_query(base=inner_tree.out.Base.INNER),
@@ -45,8 +60,8 @@ def interrogate_tree(_tree_key, inner_tree, _cookie):
     ])
 
     try:
-        with open(inner_tree.out.tree_info_file(), encoding='iso-8859-1') as f:
-            info_json = json.load(f)
+        with open(inner_tree.out.tree_info_file(), "rb") as f:
+            info_json = _json_loads(f.read())
     except FileNotFoundError as e:
         raise DescribeError(inner_tree, "No return from interrogate.") from e
     except json.decoder.JSONDecodeError as e:
@@ -55,7 +70,7 @@ def interrogate_tree(_tree_key, inner_tree, _cookie):
 
     if not isinstance(info_json, dict):
         raise DescribeError(inner_tree, "Malformed describe response")
-    if set(info_json.keys()) - _VALID_KEYS:
+    if not _VALID_KEYS.issuperset(info_json):
         raise DescribeError(inner_tree,
                             "Invalid keyname in describe response.")
     # Make sure that fields are initialized, so that we can just access them.
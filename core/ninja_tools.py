@@ -40,17 +40,28 @@ class Ninja(ninja_writer.Writer):
             builddir=context.out.root(base=context.out.Base.OUTER),
             **kwargs)
         self._context = context
-        self._did_copy_file = False
-        self._write_rule = None
+        # The names of the rules added by the helpers below.
+        self._rules_emitted = set()
         self._phonies = collections.defaultdict(set)
         self._acp = self._context.tools.acp()
+        # Map of copy_to -> copy_from for the copies already added.
+        self._copied_files = {}
 
     def add_copy_file(self, copy_to, copy_from):
-        self.add_rule(
-            Rule("copy_file", [
-                ("command",
-                 f"mkdir -p ${{out_dir}} && {self._acp} -f ${{in}} ${{out}}")
-            ]))
+        """Copy copy_from to copy_to.
+
+        Repeated requests for the same copy are only added once.
+        """
+        if self._copied_files.get(copy_to) == copy_from:
+            return
+        self._copied_files[copy_to] = copy_from
+        if "copy_file" not in self._rules_emitted:
+            self._rules_emitted.add("copy_file")
+            self.add_rule(
+                Rule("copy_file", [
+                    ("command",
+                     f"mkdir -p ${{out_dir}} && {self._acp} -f ${{in}} ${{out}}")
+                ]))
         self.add_build_action(
             BuildAction(output=copy_to,
                         rule="copy_file",
@@ -72,8 +83,9 @@ class Ninja(ninja_writer.Writer):
 
     def write(self, *args, **kwargs):
         """Write the file, including our global phonies."""
+        # Sort the deps, so that the output does not depend on set order.
         for phony, deps in self._phonies.items():
-            self.add_phony(phony, deps)
+            self.add_phony(phony, sorted(deps))
         super().write(*args, **kwargs)
 
     def add_write_file(self, filepath: str, content: str):
@@ -81,9 +93,12 @@ class Ninja(ninja_writer.Writer):
 
         The content is written as-is, special characters are not escaped
         """
-        self.add_rule(
-            Rule("write_file", [("description", "Writes content to out"),
-                                ("command", "printf '${content}' > ${out}")]))
+        if "write_file" not in self._rules_emitted:
+            self._rules_emitted.add("write_file")
+            self.add_rule(
+                Rule("write_file",
+                     [("description", "Writes content to out"),
+                      ("command", "printf '${content}' > ${out}")]))
 
         self.add_build_action(
             BuildAction(output=filepath,
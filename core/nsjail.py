@@ -14,26 +14,46 @@
 # See the License for the specific language governing permissions and
 # limitations under the License.
 
-import json
+from json.encoder import encode_basestring_ascii
+import operator
 import os
+import sys
+import tempfile
 import textwrap
 
+# The JSON (and protobuf text) forms of the mount point values.  These match
+# json.dumps, without the overhead of the full encoder.
+_quote = encode_basestring_ascii
+_BOOL_STR = {True: "true", False: "false"}
+
+
+# The values that _bool maps directly.  None and the booleans are by far the
+# most common.
+_BOOL_VALUES = {
+    None: None,
+    True: True,
+    False: False,
+    'False': False,
+    'false': False,
+    'True': True,
+    'true': True,
+}
+
 
 def _bool(value):
     """Convert string to one of None, True, False."""
-    if isinstance(value, bool):
-        return value
-    if value is None:
+    try:
+        return _BOOL_VALUES[value]
+    except KeyError:
+        pass
+    if value.lower() in ('', 'none', 'null'):
         return None
-    if value.to_lower() in ('', 'none', 'null'):
-        return None
-    if value in ('False', 'false'):
-        return False
     return bool(value)
 
 
 class Envar():
     """Environment variables."""
+    __slots__ = ("name", "value")
 
     def __init__(self, *args, name=None, value=None):
         assert not args, "Envar only accepts kwargs"
@@ -48,6 +68,27 @@ class Envar():
 
 
 class MountPt(object):
+    # The config fields, in output order, and whether each is a boolean.
+    # String fields are written when non-empty, booleans when not None.
+    _FIELDS = (
+        ("src", False),
+        ("prefix_src_env", False),
+        ("src_content", False),
+        ("dst", False),
+        ("prefix_dst_env", False),
+        ("fstype", False),
+        ("options", False),
+        ("is_bind", True),
+        ("rw", True),
+        ("is_dir", True),
+        ("mandatory", True),
+        ("is_symlink", True),
+        ("nosuid", True),
+        ("nodev", True),
+        ("noexec", True),
+    )
+    __slots__ = tuple(name for name, _ in _FIELDS) + ("_str_key", "_str")
+
     def __init__(self,
                  _kw_only=(),
                  src="",
@@ -71,12 +112,16 @@ class MountPt(object):
         assert not src or os.path.abspath(src) == src, "Paths must be absolute"
         assert not dst or os.path.abspath(dst) == dst, "Paths must be absolute"
         self.src = src
-        self.prefix_src_env = prefix_src_env
+        # The fields with few distinct values are interned, so that comparing
+        # mounts usually only compares pointers.
+        self.prefix_src_env = (sys.intern(prefix_src_env)
+                              if prefix_src_env else prefix_src_env)
         self.src_content = src_content
         self.dst = dst
-        self.prefix_dst_env = prefix_dst_env
-        self.fstype = fstype
-        self.options = options
+        self.prefix_dst_env = (sys.intern(prefix_dst_env)
+                              if prefix_dst_env else prefix_dst_env)
+        self.fstype = sys.intern(fstype) if fstype else fstype
+        self.options = sys.intern(options) if options else options
         self.is_bind = _bool(is_bind)
         self.rw = _bool(rw)
         self.is_dir = _bool(is_dir)
@@ -85,77 +130,64 @@ class MountPt(object):
         self.nosuid = _bool(nosuid)
         self.nodev = _bool(nodev)
         self.noexec = _bool(noexec)
+        # The last string returned by __str__, and the fields it was made
+        # from.  Mounts are rarely changed after they are created (only rw, by
+        # Nsjail.make_cwd_writable), so this is usually still valid.
+        self._str_key = None
+        self._str = None
 
     def __str__(self):
-        ret = "mount {\n"
-        if self.src:
-            ret += f"  src: {json.dumps(self.src)}\n"
-        if self.prefix_src_env:
-            ret += f"  prefix_src_env: {json.dumps(self.prefix_src_env)}\n"
-        if self.src_content:
-            ret += f"  src_content: {json.dumps(self.src_content)}\n"
-        if self.dst:
-            ret += f"  dst: {json.dumps(self.dst)}\n"
-        if self.prefix_dst_env:
-            ret += f"  prefix_dst_env: {json.dumps(self.prefix_dst_env)}\n"
-        if self.fstype:
-            ret += f"  fstype: {json.dumps(self.fstype)}\n"
-        if self.options:
-            ret += f"  options: {json.dumps(self.options)}\n"
-        if self.is_bind is not None:
-            ret += f"  is_bind: {json.dumps(self.is_bind)}\n"
-        if self.rw is not None:
-            ret += f"  rw: {json.dumps(self.rw)}\n"
-        if self.is_dir is not None:
-            ret += f"  is_dir: {json.dumps(self.is_dir)}\n"
-        if self.mandatory is not None:
-            ret += f"  mandatory: {json.dumps(self.mandatory)}\n"
-        if self.is_symlink is not None:
-            ret += f"  is_symlink: {json.dumps(self.is_symlink)}\n"
-        if self.nosuid is not None:
-            ret += f"  nosuid: {json.dumps(self.nosuid)}\n"
-        if self.nodev is not None:
-            ret += f"  nodev: {json.dumps(self.nodev)}\n"
-        if self.noexec is not None:
-            ret += f"  noexec: {json.dumps(self.noexec)}\n"
-        ret += "}\n\n"
-        return ret
+        key = self._astuple()
+        if key == self._str_key:
+            return self._str
+        self._str_key = key
+        self._str = self._format(key)
+        return self._str
+
+    @staticmethod
+    def _format(key):
+        """Return the config text for the fields in key (from _astuple)."""
+        parts = ["mount {\n"]
+        append = parts.append
+        quote = _quote
+        bool_str = _BOOL_STR
+        for (prefix, is_bool), value in zip(_MOUNTPT_LINES, key):
+            if is_bool:
+                if value is not None:
+                    append(f"{prefix}{bool_str[value]}\n")
+            elif value:
+                append(f"{prefix}{quote(value)}\n")
+        append("}\n\n")
+        return "".join(parts)
+
+    def _astuple(self):
+        return _mountpt_fields(self)
 
     def __eq__(self, other):
-        return (isinstance(other, MountPt) and self.src == other.src
-                and self.prefix_src_env == other.prefix_src_env
-                and self.src_content == other.src_content
-                and self.dst == other.dst
-                and self.prefix_dst_env == other.prefix_dst_env
-                and self.fstype == other.fstype
-                and self.options == other.options
-                and self.is_bind == other.is_bind and self.rw == other.rw
-                and self.is_dir == other.is_dir
-                and self.mandatory == other.mandatory
-                and self.is_symlink == other.is_symlink
-                and self.nosuid == other.nosuid and self.nodev == other.nodev
-                and self.noexec == other.noexec)
+        return (isinstance(other, MountPt)
+                and self._astuple() == other._astuple())
+
+    def __copy__(self):
+        # The fields are already validated and normalized, so skip __init__.
+        ret = MountPt.__new__(MountPt)
+        for name in MountPt.__slots__:
+            setattr(ret, name, getattr(self, name))
+        return ret
 
     def copy(self):
-        return MountPt(src=self.src,
-                       prefix_src_env=self.prefix_src_env,
-                       src_content=self.src_content,
-                       dst=self.dst,
-                       prefix_dst_env=self.prefix_dst_env,
-                       fstype=self.fstype,
-                       options=self.options,
-                       is_bind=self.is_bind,
-                       rw=self.rw,
-                       is_dir=self.is_dir,
-                       mandatory=self.mandatory,
-                       is_symlink=self.is_symlink,
-                       nosuid=self.nosuid,
-                       nodev=self.nodev,
-                       noexec=self.noexec)
+        return self.__copy__()
+
+
+# The line prefix for each MountPt field, and a getter for all of the fields
+# at once, in MountPt._FIELDS order.
+_MOUNTPT_LINES = tuple(
+    (f"  {name}: ", is_bool) for name, is_bool in MountPt._FIELDS)
+_mountpt_fields = operator.attrgetter(*(name for name, _ in MountPt._FIELDS))
 
 
 class NsjailConfigOption(object):
     """Options for nsjail configuration."""
+    __slots__ = ("name", "value", "comment")
 
     def __init__(self, name, value, comment=""):
         self.name = name
@@ -163,121 +195,199 @@ class NsjailConfigOption(object):
         self.comment = comment
 
     def __str__(self):
-        return f"{self.comment}\n{self.name}: {self.value}"
+        if self.comment:
+            return f"{self.comment}\n{self.name}: {self.value}\n"
+        return f"{self.name}: {self.value}\n"
+
+
+# The mount points that every nsjail config needs.  They are built once, and
+# copied by Nsjail.__init__.
+_DEFAULT_MOUNTS = (
+    # Mount proc so that the PID namespace can be shared between the
+    # parent and child process.
+    MountPt(src="/proc",
+            dst="/proc",
+            is_bind=True,
+            rw=True,
+            mandatory=True),
+    # Some commands may need /etc/alternatives to reach the correct
+    # binary.
+    MountPt(src="/etc/alternatives",
+            dst="/etc/alternatives",
+            is_bind=True,
+            rw=False,
+            mandatory=False),
+
+    # TODO: we may need to use something other than tmpfs for this,
+    # because of some tests, etc.
+    MountPt(dst="/tmp",
+            fstype="tmpfs",
+            rw=True,
+            is_bind=False,
+            noexec=False,
+            nodev=True,
+            nosuid=True),
+
+    # Some tools need /dev/shm to created a named semaphore. Use a new
+    # tmpfs to limit access to the external environment.
+    MountPt(dst="/dev/shm", fstype="tmpfs", rw=True, is_bind=False),
+
+    # Add the expected tty devices.
+    MountPt(src="/dev/tty", dst="/dev/tty", rw=True, is_bind=True),
+    # These are symlinks to /proc/self/fd/{0,1,2}.
+    MountPt(src="/proc/self/fd/0", dst="/dev/stdin", is_symlink=True),
+    MountPt(src="/proc/self/fd/1", dst="/dev/stdout", is_symlink=True),
+    MountPt(src="/proc/self/fd/2", dst="/dev/stderr", is_symlink=True),
+
+    # Map the working User ID to a username
+    # Some tools like Java need a valid username
+    # Inner trees building with Soong also expect the nobody UID to be
+    # available to setup its own nsjail.
+    MountPt(
+        src_content="user:x:999999:65533:user:/tmp:/bin/bash\n"
+        "nobody:x:65534:65534:nobody:/nonexistent:/usr/sbin/nologin\n",
+        dst="/etc/passwd",
+        mandatory=False),
+
+    # Define default group
+    MountPt(src_content="group::65533:user\n"
+            "nogroup::65534:nobody\n",
+            dst="/etc/group",
+            mandatory=False),
+
+    # Empty mtab file needed for some build scripts that check for
+    # images being mounted
+    MountPt(src_content="\n", dst="/etc/mtab", mandatory=False),
+
+    # Explicitly mount required device file nodes
+    #
+    # This will enable a chroot based NsJail sandbox. A chroot does not
+    # provide device file nodes. So just mount the required device file
+    # nodes directly from the host.
+    #
+    # Note that this has no effect in a docker container, since in that
+    # case NsJail will just mount the container device nodes. When we
+    # use NsJail in a docker container we mount the full file system
+    # root. So the container device nodes were already mounted in the
+    # NsJail.
+
+    # Some tools (like llvm-link) look for file descriptors in /dev/fd
+    MountPt(src="/proc/self/fd",
+            dst="/dev/fd",
+            is_symlink=True,
+            mandatory=False),
+
+    # /dev/null is a very commonly used for silencing output
+    MountPt(src="/dev/null", dst="/dev/null", rw=True, is_bind=True),
+
+    # /dev/urandom used during the creation of system.img
+    MountPt(src="/dev/urandom",
+            dst="/dev/urandom",
+            rw=False,
+            is_bind=True),
+
+    # /dev/random used by test scripts
+    MountPt(src="/dev/random",
+            dst="/dev/random",
+            rw=False,
+            is_bind=True),
+
+    # /dev/zero is required to make vendor-qemu.img
+    MountPt(src="/dev/zero", dst="/dev/zero", is_bind=True),
+    MountPt(src="/lib", dst="/lib", is_bind=True, rw=False),
+    MountPt(src="/bin", dst="/bin", is_bind=True, rw=False),
+    MountPt(src="/sbin", dst="/sbin", is_bind=True, rw=False),
+    MountPt(src="/usr", dst="/usr", is_bind=True, rw=False),
+    MountPt(src="/lib64",
+            dst="/lib64",
+            is_bind=True,
+            rw=False,
+            mandatory=False),
+    MountPt(src="/lib32",
+            dst="/lib32",
+            is_bind=True,
+            rw=False,
+            mandatory=False),
+)
+
+
+# The start of the nsjail config, before the envars, mounts and options.
+_CONFIG_HEADER = textwrap.dedent("""\
+    name: "android-build-sandbox"
+    description: "Sandboxed Android Platform Build."
+    description: "No network access and a limited access to local host resources."
+
+    log_level: {log_level}
+    # All configuration options are described in
+    # https://github.com/google/nsjail/blob/master/config.proto
+
+    # Run once then exit
+    mode: ONCE
+
+    # No time limit
+    time_limit: 0
+
+    # Limits memory usage
+    rlimit_as_type: SOFT
+    # Maximum size of core dump files
+    rlimit_core_type: SOFT
+    # Limits use of CPU time
+    rlimit_cpu_type: SOFT
+    # Maximum file size
+    rlimit_fsize_type: SOFT
+    # Maximum number of file descriptors opened
+    rlimit_nofile_type: SOFT
+    # Maximum stack size
+    rlimit_stack_type: SOFT
+    # Maximum number of threads
+    rlimit_nproc_type: SOFT
+
+    # Allow terminal control
+    # This let's users cancel jobs with CTRL-C without exiting the
+    # jail.
+    skip_setsid: true
+
+    # Below are all the host paths that shall be mounted
+    # to the sandbox
+
+    # TODO: Determine if we need to have /proc from outside of the jail.
+    mount_proc: false
+
+    # The user must mount the source to /src using --bindmount
+    # It will be set as the initial working directory
+    cwd: "{cwd}"
+
+    # The sandbox User ID was chosen arbitrarily
+    uidmap {{
+      inside_id: "999999"
+      outside_id: ""
+      count: 1
+    }}
+
+    # The sandbox Group ID was chosen arbitrarily
+    gidmap {{
+      inside_id: "65533"
+      outside_id: ""
+      count: 1
+    }}
+
+    # Share PID namespace between parent and child process.
+    # Sharing the PID namespace ensures that the Bazel daemon does not
+    # get killed after every invocation.
+    clone_newpid: false
+
+    """)
 
 
 class Nsjail(object):
     def __init__(self, cwd, verbose=False):
         self.cwd = cwd
         self.verbose = verbose
-        # Add the mount points that we always need.
-        self.mounts = [
-            # Mount proc so that the PID namespace can be shared between the
-            # parent and child process.
-            MountPt(src="/proc",
-                    dst="/proc",
-                    is_bind=True,
-                    rw=True,
-                    mandatory=True),
-            # Some commands may need /etc/alternatives to reach the correct
-            # binary.
-            MountPt(src="/etc/alternatives",
-                    dst="/etc/alternatives",
-                    is_bind=True,
-                    rw=False,
-                    mandatory=False),
-
-            # TODO: we may need to use something other than tmpfs for this,
-            # because of some tests, etc.
-            MountPt(dst="/tmp",
-                    fstype="tmpfs",
-                    rw=True,
-                    is_bind=False,
-                    noexec=False,
-                    nodev=True,
-                    nosuid=True),
-
-            # Some tools need /dev/shm to created a named semaphore. Use a new
-            # tmpfs to limit access to the external environment.
-            MountPt(dst="/dev/shm", fstype="tmpfs", rw=True, is_bind=False),
-
-            # Add the expected tty devices.
-            MountPt(src="/dev/tty", dst="/dev/tty", rw=True, is_bind=True),
-            # These are symlinks to /proc/self/fd/{0,1,2}.
-            MountPt(src="/proc/self/fd/0", dst="/dev/stdin", is_symlink=True),
-            MountPt(src="/proc/self/fd/1", dst="/dev/stdout", is_symlink=True),
-            MountPt(src="/proc/self/fd/2", dst="/dev/stderr", is_symlink=True),
-
-            # Map the working User ID to a username
-            # Some tools like Java need a valid username
-            # Inner trees building with Soong also expect the nobody UID to be
-            # available to setup its own nsjail.
-            MountPt(
-                src_content="user:x:999999:65533:user:/tmp:/bin/bash\n"
-                "nobody:x:65534:65534:nobody:/nonexistent:/usr/sbin/nologin\n",
-                dst="/etc/passwd",
-                mandatory=False),
-
-            # Define default group
-            MountPt(src_content="group::65533:user\n"
-                    "nogroup::65534:nobody\n",
-                    dst="/etc/group",
-                    mandatory=False),
-
-            # Empty mtab file needed for some build scripts that check for
-            # images being mounted
-            MountPt(src_content="\n", dst="/etc/mtab", mandatory=False),
-
-            # Explicitly mount required device file nodes
-            #
-            # This will enable a chroot based NsJail sandbox. A chroot does not
-            # provide device file nodes. So just mount the required device file
-            # nodes directly from the host.
-            #
-            # Note that this has no effect in a docker container, since in that
-            # case NsJail will just mount the container device nodes. When we
-            # use NsJail in a docker container we mount the full file system
-            # root. So the container device nodes were already mounted in the
-            # NsJail.
-
-            # Some tools (like llvm-link) look for file descriptors in /dev/fd
-            MountPt(src="/proc/self/fd",
-                    dst="/dev/fd",
-                    is_symlink=True,
-                    mandatory=False),
-
-            # /dev/null is a very commonly used for silencing output
-            MountPt(src="/dev/null", dst="/dev/null", rw=True, is_bind=True),
-
-            # /dev/urandom used during the creation of system.img
-            MountPt(src="/dev/urandom",
-                    dst="/dev/urandom",
-                    rw=False,
-                    is_bind=True),
-
-            # /dev/random used by test scripts
-            MountPt(src="/dev/random",
-                    dst="/dev/random",
-                    rw=False,
-                    is_bind=True),
-
-            # /dev/zero is required to make vendor-qemu.img
-            MountPt(src="/dev/zero", dst="/dev/zero", is_bind=True),
-            MountPt(src="/lib", dst="/lib", is_bind=True, rw=False),
-            MountPt(src="/bin", dst="/bin", is_bind=True, rw=False),
-            MountPt(src="/sbin", dst="/sbin", is_bind=True, rw=False),
-            MountPt(src="/usr", dst="/usr", is_bind=True, rw=False),
-            MountPt(src="/lib64",
-                    dst="/lib64",
-                    is_bind=True,
-                    rw=False,
-                    mandatory=False),
-            MountPt(src="/lib32",
-                    dst="/lib32",
-                    is_bind=True,
-                    rw=False,
-                    mandatory=False),
-        ]
+        # Add the mount points that we always need.  They are copied, since
+        # make_cwd_writable may change them.
+        self.mounts = [x.copy() for x in _DEFAULT_MOUNTS]
+        # Map of dst -> mount, kept in sync with self.mounts.
+        self._mounts_by_dst = {x.dst: x for x in self.mounts}
 
         self.envars = [
             # Some tools in the build toolchain expect a $HOME to be set Point
@@ -291,6 +401,9 @@ class Nsjail(object):
             Envar(name="PATH", value="/usr/bin:/usr/sbin:/bin:/sbin"),
         ]
         self.options = []
+        # Map of filename -> the config bytes last written to (or found in)
+        # that file by generate_config.
+        self._written = {}
 
     def make_cwd_writable(self):
         """Mark things under cwd writable."""
@@ -302,7 +415,9 @@ class Nsjail(object):
 
     def add_mountpt(self, **kwargs):
         """Add a mountpoint to the config."""
-        self.mounts.append(MountPt(**kwargs))
+        mount = MountPt(**kwargs)
+        self.mounts.append(mount)
+        self._mounts_by_dst[mount.dst] = mount
 
     def add_envar(self, **kwargs):
         """Add an envar to the config."""
@@ -315,7 +430,10 @@ class Nsjail(object):
     def copy(self):
         """Return a copy of ourselves."""
         ret = Nsjail(self.cwd, verbose=self.verbose)
-        ret.mounts = [x.copy() for x in self.mounts()]
+        ret.mounts = [x.copy() for x in self.mounts]
+        ret._mounts_by_dst = {x.dst: x for x in ret.mounts}
+        ret.envars = list(self.envars)
+        ret.options = list(self.options)
         return ret
 
     @property
@@ -324,19 +442,21 @@ class Nsjail(object):
 
       Returns a list of mount points (destinations) for the nsjail.
       """
-        return (x.dst for x in self.mounts)
+        return self._mounts_by_dst.keys()
 
     def add_nsjail(self, other):
         """Add another Nsjail object to this one."""
         # WARNING: clone_newnet option of inner tree should not be merged into
         # the combined nsjsail.cfg.
         assert other.cwd.startswith(self.cwd), "Must be a subdir"
-        our_mounts = {x.dst: x for x in self.mounts}
+        our_mounts = self._mounts_by_dst
         for mount in other.mounts:
-            if mount.dst not in our_mounts:
+            ours = our_mounts.get(mount.dst)
+            if ours is None:
                 self.mounts.append(mount)
+                our_mounts[mount.dst] = mount
             else:
-                assert mount == our_mounts[mount.dst]
+                assert mount == ours
 
     def generate_config(self, fn):
         """Generate the nsjail config file.
@@ -347,82 +467,59 @@ class Nsjail(object):
         Returns:
           (str) The configuration written.
         """
-        data = textwrap.dedent(f"""\
-            name: "android-build-sandbox"
-            description: "Sandboxed Android Platform Build."
-            description: "No network access and a limited access to local host resources."
-
-            log_level: {"INFO" if self.verbose else "WARNING"}
-            # All configuration options are described in
-            # https://github.com/google/nsjail/blob/master/config.proto
-
-            # Run once then exit
-            mode: ONCE
-
-            # No time limit
-            time_limit: 0
-
-            # Limits memory usage
-            rlimit_as_type: SOFT
-            # Maximum size of core dump files
-            rlimit_core_type: SOFT
-            # Limits use of CPU time
-            rlimit_cpu_type: SOFT
-            # Maximum file size
-            rlimit_fsize_type: SOFT
-            # Maximum number of file descriptors opened
-            rlimit_nofile_type: SOFT
-            # Maximum stack size
-            rlimit_stack_type: SOFT
-            # Maximum number of threads
-            rlimit_nproc_type: SOFT
-
-            # Allow terminal control
-            # This let's users cancel jobs with CTRL-C without exiting the
-            # jail.
-            skip_setsid: true
-
-            # Below are all the host paths that shall be mounted
-            # to the sandbox
-
-            # TODO: Determine if we need to have /proc from outside of the jail.
-            mount_proc: false
-
-            # The user must mount the source to /src using --bindmount
-            # It will be set as the initial working directory
-            cwd: "{self.cwd}"
-
-            # The sandbox User ID was chosen arbitrarily
-            uidmap {{
-              inside_id: "999999"
-              outside_id: ""
-              count: 1
-            }}
-
-            # The sandbox Group ID was chosen arbitrarily
-            gidmap {{
-              inside_id: "65533"
-              outside_id: ""
-              count: 1
-            }}
-
-            # Share PID namespace between parent and child process.
-            # Sharing the PID namespace ensures that the Bazel daemon does not
-            # get killed after every invocation.
-            clone_newpid: false
-
-            """)
-        for envar in self.envars:
-            data += f'{envar}'
-        data += '\n'
-        for mount in self.mounts:
-            data += f'{mount}'
-        data += '\n'
-        for option in self.options:
-            data += f"{option}"
+        data = _CONFIG_HEADER.format(
+            log_level="INFO" if self.verbose else "WARNING", cwd=self.cwd)
+        chunks = [data]
+        chunks.extend(str(x) for x in self.envars)
+        chunks.append('\n')
+        chunks.extend(str(x) for x in self.mounts)
+        chunks.append('\n')
+        chunks.extend(str(x) for x in self.options)
+        data = "".join(chunks)
 
         if fn:
-            os.makedirs(os.path.dirname(fn), exist_ok=True)
-            with open(fn, "w", encoding="iso-8859-1") as f:
-                f.write(data)
+            raw = data.encode("iso-8859-1")
+            # The file may have been removed since it was last written.
+            if self._written.get(fn) != raw or not os.path.exists(fn):
+                if not _file_has_contents(fn, raw):
+                    _write_file_atomic(fn, raw)
+                self._written[fn] = raw
         return data
+
+
+def _file_has_contents(fn, raw):
+    """Return whether the file fn already holds the bytes raw."""
+    try:
+        with open(fn, "rb") as f:
+            # A size mismatch settles it without reading the file.
+            if os.fstat(f.fileno()).st_size != len(raw):
+                return False
+            return f.read() == raw
+    except FileNotFoundError:
+        return False
+
+
+# The process umask.  It can only be read by setting it, which is not safe
+# once other threads are running, so read it once at import.
+_UMASK = os.umask(0o022)
+os.umask(_UMASK)
+
+
+def _write_file_atomic(fn, raw):
+    """Write the bytes raw to fn, replacing it atomically.
+
+    An interrupted write never leaves a partial config behind.
+    """
+    dirname = os.path.dirname(fn)
+    os.makedirs(dirname, exist_ok=True)
+    f = tempfile.NamedTemporaryFile("wb", dir=dirname, delete=False)
+    try:
+        with f:
+            f.write(raw)
+            # NamedTemporaryFile creates the file 0600: give it the mode that
+            # open() would have.
+            os.fchmod(f.fileno(), 0o666 & ~_UMASK)
+        os.replace(f.name, fn)
+    except BaseException:
+        os.remove(f.name)
+        raise
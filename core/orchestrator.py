@@ -15,19 +15,13 @@
 # limitations under the License.
 
 import argparse
+from concurrent import futures
 import os
-import subprocess
 import sys
 
-import api_assembly
 import api_domain
-import api_export
-import final_packaging
 import inner_tree
-import tree_analysis
-import interrogate
 import lunch
-import ninja_runner
 import nsjail
 import utils
 
@@ -101,9 +95,8 @@ class Orchestrator():
 
         def add(domain_name, tree_root, product):
             tree_key = inner_tree.InnerTreeKey(tree_root, product)
-            if tree_key in trees:
-                tree = trees[tree_key]
-            else:
+            tree = trees.get(tree_key)
+            if tree is None:
                 tree = inner_tree.InnerTree(context, tree_root, product,
                                             self.variant)
                 trees[tree_key] = tree
@@ -162,27 +155,42 @@ class Orchestrator():
 
     def _build(self):
         """Orchestrate the build."""
+        # The build phases are only imported here, so that the shell does not
+        # pay to load them.
+        # pylint: disable=import-outside-toplevel
+        import api_assembly
+        import api_export
+        import final_packaging
+        import interrogate
+        import ninja_runner
+        import tree_analysis
 
         context = self.context
         inner_trees = self.inner_trees
         jail_cfg = self._create_nsjail_config()
 
-        # 1. Interrogate the trees
-        description = inner_trees.for_each_tree(interrogate.interrogate_tree)
-        # TODO: Do something when bazel_only is True.  Provided now as an
-        # example of how we can query the interrogation results.
-        _bazel_only = len(inner_trees.keys()) == 1 and all(
-            x.get("single_bazel_optimization_available")
-            for x in description.values())
-
-        # 2a. API Export
-        inner_trees.for_each_tree(api_export.export_apis_from_tree)
-
-        # 2b. API Surface Assembly
-        api_assembly.assemble_apis(context, inner_trees)
-
-        # 3a. Inner tree analysis
-        tree_analysis.analyze_trees(context, inner_trees)
+        # The inner trees are independent, so run their inner_build commands
+        # concurrently.
+        with futures.ThreadPoolExecutor(
+                max_workers=len(inner_trees.keys()) or 1) as executor:
+            # 1. Interrogate the trees
+            description = inner_trees.for_each_tree(interrogate.interrogate_tree,
+                                                    executor=executor)
+            # TODO: Do something when bazel_only is True.  Provided now as an
+            # example of how we can query the interrogation results.
+            _bazel_only = len(inner_trees.keys()) == 1 and all(
+                x.get("single_bazel_optimization_available")
+                for x in description.values())
+
+            # 2a. API Export
+            inner_trees.for_each_tree(api_export.export_apis_from_tree,
+                                      executor=executor)
+
+            # 2b. API Surface Assembly
+            api_assembly.assemble_apis(context, inner_trees)
+
+            # 3a. Inner tree analysis
+            tree_analysis.analyze_trees(context, inner_trees, executor=executor)
 
         # 3b. Final Packaging Rules
         final_packaging.final_packaging(context, inner_trees)
@@ -200,7 +208,10 @@ class Orchestrator():
         return EXIT_STATUS_OK
 
     def _shell(self):
-        """Launch a shell."""
+        """Launch a shell.
+
+        The shell replaces this process, so this does not return.
+        """
 
         jail_cfg = self._create_nsjail_config()
         jail_cfg.add_envar(name='TERM')  # Pass TERM to the nsjail environment.
@@ -220,10 +231,21 @@ class Orchestrator():
         # Construct the command
         cmd = [nsjail_bin, "--config", nsjail_config_file, "--", "/bin/bash"]
 
-        # Run the shell, and ignore errors from the interactive shell.
+        # Replace ourselves with the shell: there is nothing left to do once
+        # it exits, and its exit status becomes ours.  The exec skips the
+        # interpreter's exit-time cleanup, which is safe here:
+        # - Run() and __main__ have no finally blocks or context managers
+        #   around this call;
+        # - the shell path creates no thread pool, so there are no worker
+        #   threads for concurrent.futures to join at exit;
+        # - the only atexit handler is logging.shutdown, and no logging
+        #   handlers are configured;
+        # - stdout and stderr are flushed just below.
+        # If any of that changes, run the shell with subprocess instead.
         print(f"Running: {' '.join(cmd)}")
-        subprocess.run(cmd, shell=False, check=False)
-        return EXIT_STATUS_OK
+        sys.stdout.flush()
+        sys.stderr.flush()
+        os.execvp(nsjail_bin, cmd)
 
     def Run(self):
         """Orchestrate the build."""
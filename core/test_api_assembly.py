@@ -0,0 +1,118 @@
+#!/usr/bin/env python
+#
+# Copyright (C) 2023 The Android Open Source Project
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""Unit tests for api_assembly.py."""
+
+import contextlib
+import io
+import json
+import os
+import tempfile
+from types import SimpleNamespace
+import unittest
+
+import api_assembly
+
+
+class TestContributionFiles(unittest.TestCase):
+
+    def setUp(self):
+        self._tmpdir = tempfile.TemporaryDirectory()
+        self.addCleanup(self._tmpdir.cleanup)
+        self.dir = self._tmpdir.name
+
+    def touch(self, name):
+        with open(os.path.join(self.dir, name), "w", encoding="iso-8859-1"):
+            pass
+
+    def contribution_files(self):
+        inner_tree = SimpleNamespace(out=SimpleNamespace(
+            api_contributions_dir=lambda: self.dir))
+        result = api_assembly.api_contribution_files_for_inner_tree(
+            None, inner_tree, None)
+        return sorted(x.name for x in result)
+
+    def test_json_files(self):
+        self.touch("a.json")
+        self.touch("b.txt")
+        os.mkdir(os.path.join(self.dir, "c.json"))
+        self.assertEqual(self.contribution_files(), ["a.json"])
+
+    def test_symlinked_file(self):
+        other = tempfile.TemporaryDirectory()
+        self.addCleanup(other.cleanup)
+        target = os.path.join(other.name, "target.json")
+        with open(target, "w", encoding="iso-8859-1"):
+            pass
+        os.symlink(target, os.path.join(self.dir, "link.json"))
+        self.assertEqual(self.contribution_files(), ["link.json"])
+
+
+class TestReadContributionFile(unittest.TestCase):
+
+    def read(self, text):
+        with tempfile.NamedTemporaryFile("w", suffix=".json",
+                                         encoding="iso-8859-1") as f:
+            f.write(text)
+            f.flush()
+            return api_assembly._read_contribution_file(f.name)
+
+    def test_valid(self):
+        data = {"name": "publicapi", "version": 1, "api_domain": "system"}
+        self.assertEqual(self.read(json.dumps(data)), data)
+
+    def test_empty(self):
+        self.assertEqual(self.read("{}"), {})
+
+    def test_missing_keys(self):
+        self.assertIsInstance(self.read('{"name": "publicapi"}'),
+                              api_assembly.ContributionError)
+
+
+class TestContributionCache(unittest.TestCase):
+
+    def setUp(self):
+        self._tmpdir = tempfile.TemporaryDirectory()
+        self.addCleanup(self._tmpdir.cleanup)
+        self.filename = os.path.join(self._tmpdir.name, "cache.pkl")
+
+    def test_round_trip(self):
+        cache = {("a.json", 1, 2): {"name": "publicapi"}}
+        api_assembly.save_contribution_cache(self.filename, cache)
+        self.assertEqual(api_assembly.load_contribution_cache(self.filename),
+                         cache)
+
+    def test_missing(self):
+        self.assertEqual(api_assembly.load_contribution_cache(self.filename),
+                         {})
+
+    def test_corrupt(self):
+        api_assembly.save_contribution_cache(self.filename, {"a": 1})
+        with open(self.filename, "rb") as f:
+            data = f.read()
+        # A truncated file, and a reference to a class that does not exist.
+        for raw in (data[:len(data) // 2], b"cnosuchmodule\nthing\n."):
+            with self.subTest(raw=raw):
+                with open(self.filename, "wb") as f:
+                    f.write(raw)
+                with contextlib.redirect_stderr(io.StringIO()):
+                    self.assertEqual(
+                        api_assembly.load_contribution_cache(self.filename),
+                        {})
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -15,11 +15,12 @@
 # limitations under the License.
 """Unit tests for build_file_generator.py"""
 
+import os
 import unittest
 import tempfile
 
 from build_file_generator import ConfigAxis, \
-AndroidBpModule, AndroidBpComment, AndroidBpFile
+AndroidBpModule, AndroidBpComment, AndroidBpFile, BuildFileGenerator
 
 
 class TestAndroidBpModule(unittest.TestCase):
@@ -147,6 +148,107 @@ cc_api_library {
                 "This comment should force creation of a new Android.bp")
             self.assertTrue(bp_file.is_stale())
 
+    def test_stale_file_module_changed(self):
+        with tempfile.TemporaryDirectory() as tmpdir:
+            bp_file = AndroidBpFile(tmpdir)
+            module = AndroidBpModule(name="libfoo",
+                                     module_type="cc_api_library")
+            bp_file.add_module(module)
+            bp_file.write()
+            self.assertFalse(bp_file.is_stale())
+            # Modules can be modified after they are added to the file.
+            module.add_property(prop="src", val="libfoo.so")
+            self.assertTrue(bp_file.is_stale())
+            bp_file.write()
+            self.assertFalse(bp_file.is_stale())
+
+    def test_write_with_manifest(self):
+        with tempfile.TemporaryDirectory() as tmpdir:
+            bp_file = AndroidBpFile(tmpdir)
+            bp_file.add_comment_string("This is a comment")
+            manifest = {}
+            bp_file.write(manifest=manifest)
+            self.assertIn(bp_file.fullpath(), manifest)
+            self.assertFalse(bp_file.is_stale())
+
+            # A change made behind our back is noticed, since the file no
+            # longer matches the recorded size.
+            with open(bp_file.fullpath(), "w", encoding='iso-8859-1') as f:
+                f.write("// edited")
+            bp_file.write(manifest=manifest)
+            self.assertFalse(bp_file.is_stale())
+
+            # A deleted file is recreated.
+            os.remove(bp_file.fullpath())
+            bp_file.write(manifest=manifest)
+            self.assertFalse(bp_file.is_stale())
+
+
+class TestBuildFileGenerator(unittest.TestCase):
+
+    def test_manifest(self):
+        with tempfile.TemporaryDirectory() as tmpdir:
+            manifest_file = os.path.join(tmpdir, "work", "manifest.json")
+            bp_file = AndroidBpFile(os.path.join(tmpdir, "a"))
+            bp_file.add_comment_string("This is a comment")
+            generator = BuildFileGenerator(manifest_file)
+            generator.add_android_bp_file(bp_file)
+            generator.write()
+            self.assertTrue(os.path.exists(manifest_file))
+            self.assertFalse(bp_file.is_stale())
+
+            # Update the file using the saved manifest.
+            bp_file.add_comment_string("Another comment")
+            generator = BuildFileGenerator(manifest_file)
+            generator.add_android_bp_file(bp_file)
+            generator.write()
+            self.assertFalse(bp_file.is_stale())
+
+    def test_clean(self):
+        with tempfile.TemporaryDirectory() as tmpdir:
+            kept = AndroidBpFile(os.path.join(tmpdir, "a", "kept"))
+            kept.add_comment_string("This is a comment")
+            dropped = AndroidBpFile(os.path.join(tmpdir, "a", "b", "dropped"))
+            dropped.add_comment_string("This is a comment")
+            kept.write()
+            dropped.write()
+            other = os.path.join(tmpdir, "a", "b", "other.txt")
+            with open(other, "w", encoding='iso-8859-1') as f:
+                f.write("")
+
+            generator = BuildFileGenerator()
+            generator.add_android_bp_file(kept)
+            generator.clean(tmpdir)
+            self.assertTrue(os.path.exists(kept.fullpath()))
+            self.assertFalse(os.path.exists(dropped.fullpath()))
+            self.assertTrue(os.path.exists(other))
+
+            # A missing staging directory has nothing to clean.
+            generator.clean(os.path.join(tmpdir, "missing"))
+
+    def test_clean_matches_walk_paths(self):
+        with tempfile.TemporaryDirectory() as tmpdir:
+            def touch(*path):
+                filename = os.path.join(tmpdir, *path)
+                os.makedirs(os.path.dirname(filename), exist_ok=True)
+                with open(filename, "w", encoding='iso-8859-1') as f:
+                    f.write("")
+                return filename
+
+            # Names ending in Android.bp are matched.
+            suffixed = touch("a", "old.Android.bp")
+            # Files more than 10 directories deep are not.
+            deep = touch(*(["d"] * 11), "Android.bp")
+            # An entry that cannot be stat'ed does not stop the scan.
+            os.symlink("loop.Android.bp",
+                       os.path.join(tmpdir, "loop.Android.bp"))
+            dropped = touch("z", "Android.bp")
+
+            BuildFileGenerator().clean(tmpdir)
+            self.assertFalse(os.path.exists(suffixed))
+            self.assertTrue(os.path.exists(deep))
+            self.assertFalse(os.path.exists(dropped))
+
 
 if __name__ == "__main__":
     unittest.main()
@@ -14,8 +14,10 @@
 # See the License for the specific language governing permissions and
 # limitations under the License.
 
+from concurrent import futures
 import os
 import tempfile
+import threading
 import unittest
 
 import inner_tree
@@ -60,6 +62,14 @@ class TestInnerTreeKey(unittest.TestCase):
         self.assertLess(k1, k2)
         self.assertGreater(k2, k1)
 
+    def test_no_product(self):
+        k1 = inner_tree.InnerTreeKey('inner', None)
+        k2 = inner_tree.InnerTreeKey('inner', '')
+        self.assertEqual(k1, inner_tree.InnerTreeKey('inner', None))
+        self.assertNotEqual(k1, k2)
+        self.assertLess(k1, k2)
+        self.assertGreater(k2, k1)
+
 
 class TestInnerTree(unittest.TestCase):
     def setUp(self):
@@ -105,6 +115,66 @@ class TestInnerTree(unittest.TestCase):
         self.assertEqual(os.path.abspath(os.path.join('inner', 'p3')), srcs[p3].dst)
 
 
+class TestInnerTrees(unittest.TestCase):
+    def test_for_each_tree(self):
+        keys = [inner_tree.InnerTreeKey(x, 'product') for x in ('b', 'a', 'c')]
+        trees = inner_tree.InnerTrees({k: k.root for k in keys}, {})
+
+        def func(tree_key, tree, cookie):
+            return (tree, cookie)
+
+        expected = [(k, (k.root, 'cookie')) for k in sorted(keys)]
+        self.assertEqual(
+            list(trees.for_each_tree(func, cookie='cookie').items()), expected)
+        with futures.ThreadPoolExecutor(max_workers=3) as executor:
+            result = trees.for_each_tree(func,
+                                         cookie='cookie',
+                                         executor=executor)
+        self.assertEqual(list(result.items()), expected)
+
+    def test_for_each_tree_stops_on_error(self):
+        keys = [inner_tree.InnerTreeKey(x, 'product') for x in ('a', 'b')]
+        trees = inner_tree.InnerTrees({k: k.root for k in keys}, {})
+        release = threading.Event()
+
+        def func(tree_key, tree, cookie):
+            if tree == 'b':
+                raise ValueError(tree)
+            # Tree 'a' is still running when 'b' fails.
+            release.wait(10)
+            return tree
+
+        with futures.ThreadPoolExecutor(max_workers=2) as executor:
+            try:
+                with self.assertRaises(ValueError):
+                    trees.for_each_tree(func, executor=executor)
+                self.assertFalse(release.is_set())
+            finally:
+                release.set()
+
+    def test_tree_run(self):
+
+        class FakeProcess(object):
+            terminated = False
+
+            def terminate(self):
+                self.terminated = True
+
+        run = inner_tree._TreeRun()
+        running = FakeProcess()
+        run.add(running)
+        run.stop()
+        self.assertTrue(running.terminated)
+        # Processes added after the stop are terminated at once.
+        late = FakeProcess()
+        run.add(late)
+        self.assertTrue(late.terminated)
+        # Each for_each_tree call has its own state.
+        other = FakeProcess()
+        inner_tree._TreeRun().add(other)
+        self.assertFalse(other.terminated)
+
+
 if __name__ == "__main__":
     unittest.main()
 
@@ -16,6 +16,7 @@
 
 import os
 import shutil
+import stat
 import tempfile
 import unittest
 
@@ -55,6 +56,31 @@ class TestMountPt(unittest.TestCase):
                 self.assertEqual(str(mnt),
                                  f'mount {{\n  {name}: false\n}}\n\n')
 
+    def test_none_strings(self):
+        mnt = nsjail.MountPt(dst="/x", fstype=None, options=None)
+        self.assertEqual(str(mnt), 'mount {\n  dst: "/x"\n}\n\n')
+
+    def test_eq(self):
+        mnt = nsjail.MountPt(src="/src", dst="/dst", is_bind=True, rw=False)
+        self.assertEqual(mnt, mnt.copy())
+        other = mnt.copy()
+        other.rw = True
+        self.assertNotEqual(mnt, other)
+        self.assertNotEqual(mnt, "/dst")
+
+    def test_str_after_change(self):
+        mnt = nsjail.MountPt(dst="/dst", rw=False)
+        self.assertEqual(str(mnt), 'mount {\n  dst: "/dst"\n  rw: false\n}\n\n')
+        mnt.rw = True
+        self.assertEqual(str(mnt), 'mount {\n  dst: "/dst"\n  rw: true\n}\n\n')
+
+    def test_bool_strings(self):
+        for value, expected in (("true", True), ("True", True),
+                                ("false", False), ("False", False),
+                                ("", None), ("None", None), ("null", None)):
+            with self.subTest(value=value):
+                self.assertIs(nsjail.MountPt(rw=value).rw, expected)
+
     def test_absolute_paths(self):
         """Test that src and dst must be absolute paths."""
         with self.assertRaises(AssertionError):
@@ -72,6 +98,21 @@ class TestNsjail(unittest.TestCase):
     def tearDown(self):
         shutil.rmtree(self.test_dir)
 
+    def test_copy(self):
+        self.cfg.add_mountpt(src="/src", dst="/dst", is_bind=True, rw=False)
+        self.cfg.add_envar(name="FOO", value="bar")
+        cfg = self.cfg.copy()
+        self.assertEqual(self.config, cfg.generate_config(fn=None))
+        # The mounts are copies.
+        cfg.mounts[-1].rw = True
+        self.assertFalse(self.cfg.mounts[-1].rw)
+
+    def test_default_mounts_not_shared(self):
+        cfg = nsjail.Nsjail("/dev")
+        cfg.make_cwd_writable()
+        self.assertTrue(cfg._mounts_by_dst["/dev/zero"].rw)
+        self.assertIsNone(nsjail.Nsjail("/dev")._mounts_by_dst["/dev/zero"].rw)
+
     @property
     def config(self):
         return self.cfg.generate_config(fn=None)
@@ -83,6 +124,34 @@ class TestNsjail(unittest.TestCase):
             config = f.read()
         self.assertEqual(self.config, config)
 
+    def test_WriteConfigUnchanged(self):
+        self.cfg.generate_config(fn=self.cfg_name)
+        mtime = os.stat(self.cfg_name).st_mtime_ns
+        os.utime(self.cfg_name, ns=(mtime - 10**9, mtime - 10**9))
+        # Regenerating the same config leaves the file alone.
+        self.cfg.generate_config(fn=self.cfg_name)
+        self.assertEqual(os.stat(self.cfg_name).st_mtime_ns, mtime - 10**9)
+        # A changed config is written.
+        self.cfg.add_envar(name="FOO", value="bar")
+        self.cfg.generate_config(fn=self.cfg_name)
+        with open(self.cfg_name, encoding="iso-8859-1") as f:
+            self.assertEqual(self.config, f.read())
+
+    def test_WriteConfigMode(self):
+        self.cfg.generate_config(fn=self.cfg_name)
+        umask = os.umask(0o022)
+        os.umask(umask)
+        self.assertEqual(stat.S_IMODE(os.stat(self.cfg_name).st_mode),
+                         0o666 & ~umask)
+
+    def test_WriteConfigRemoved(self):
+        self.cfg.generate_config(fn=self.cfg_name)
+        os.remove(self.cfg_name)
+        # A removed config is written again, even though it is unchanged.
+        self.cfg.generate_config(fn=self.cfg_name)
+        with open(self.cfg_name, encoding="iso-8859-1") as f:
+            self.assertEqual(self.config, f.read())
+
     def testDefault(self):
         # Verify that a default entry is present.
         self.assertIn(
@@ -95,6 +164,26 @@ class TestNsjail(unittest.TestCase):
             ('\nmount {\n  src: "/proc"\n  dst: "/proc"\n  is_bind: true\n  '
              'rw: true\n  mandatory: true\n}\n'), self.config)
 
+    def test_add_nsjail(self):
+        other = nsjail.Nsjail(os.path.join(self.test_dir, "inner"))
+        other.add_mountpt(src="/src", dst="/dst", is_bind=True)
+        count = len(self.cfg.mounts)
+        self.cfg.add_nsjail(other)
+        self.assertEqual(len(self.cfg.mounts), count + 1)
+        self.assertEqual(self.cfg.mounts[-1].dst, "/dst")
+        # Merging again does not add the mounts twice.
+        self.cfg.add_nsjail(other)
+        self.assertEqual(len(self.cfg.mounts), count + 1)
+
+    def test_options(self):
+        self.cfg.add_option(name="clone_newnet", value="false")
+        self.cfg.add_option(name="clone_newuts",
+                            value="true",
+                            comment="# New UTS namespace")
+        self.assertTrue(
+            self.config.endswith('}\n\n\nclone_newnet: false\n'
+                                 '# New UTS namespace\nclone_newuts: true\n'))
+
     def testCwd(self):
         self.cfg = nsjail.Nsjail(cwd="/cwd")
         self.assertIn('\ncwd: "/cwd"\n', self.config)
@@ -15,18 +15,24 @@
 import os
 
 
-def analyze_trees(context, inner_trees):
-    inner_trees.for_each_tree(run_analysis)
+def analyze_trees(context, inner_trees, executor=None):
+    # The current directory is the same for every tree, so look it up once.
+    inner_trees.for_each_tree(run_analysis,
+                              cookie=os.getcwd(),
+                              executor=executor)
 
 
 def run_analysis(tree_key, inner_tree, cookie):
-    """Call inner_build analyze."""
+    """Call inner_build analyze.
+
+    cookie is the current directory.
+    """
     context = inner_tree.context
     cmd = ["analyze"]
 
     # Pass the abspath of the inner_tree.  The nsjail config will change
     # directory to this path at invocation.
-    cmd.extend(["--inner_tree", os.path.join(os.getcwd(), inner_tree.root)])
+    cmd.extend(["--inner_tree", os.path.join(cookie, inner_tree.root)])
 
     # Pass the api_surfaces directory.
     cmd.extend(["--api_surfaces_dir",
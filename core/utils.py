@@ -15,8 +15,10 @@
 # limitations under the License.
 
 import enum
+import functools
 import os
 import platform
+import threading
 
 _API_SURFACES = "api_surfaces"
 _INTERMEDIATES = "intermediates"
@@ -30,7 +32,7 @@ class Context(object):
     def __init__(self, out_root, errors):
         self.out = OutDir(out_root)
         self.errors = errors
-        self.tools = HostTools()
+        self.tools = _host_tools()
 
 
 class ContextTest(Context):
@@ -79,10 +81,11 @@ class OutDir(object):
           out_path: Where the outer tree out_dir will be mapped, relative to the
                     outer tree root. Usually "out".
         """
-        self._base = {}
-        self._base[self.Base.ORIGIN] = out_origin
-        self._base[self.Base.OUTER] = out_path
-        self._base[self.Base.DEFAULT] = self._base[self.Base.ORIGIN]
+        # The base paths, indexed by OutDirBase value.  DEFAULT is ORIGIN.
+        self._bases = (out_origin, out_origin, out_path)
+        # Map of (args, base) -> path.  The same paths are asked for once per
+        # inner tree and per API library.
+        self._paths = {}
 
     def _generate_path(self,
                        *args,
@@ -95,7 +98,13 @@ class OutDir(object):
           base: Which base path to use.
           abspath: Whether to return the absolute path.
         """
-        ret = os.path.join(self._base[base], *args)
+        key = (args, base)
+        ret = self._paths.get(key)
+        if ret is None:
+            ret = self._paths[key] = os.path.join(self._bases[base.value],
+                                                  *args)
+        # The absolute path depends on the current directory, so it is not
+        # cached.
         if abspath:
             ret = os.path.abspath(ret)
         return ret
@@ -170,20 +179,18 @@ class Errors(object):
 
     def error(self, message, file=None, line=None, col=None):
         """Record the error message."""
-        s = ""
+        parts = []
         if file:
-            s += str(file)
-            s += ":"
+            parts += (str(file), ":")
         if line:
-            s += str(line)
-            s += ":"
+            parts += (str(line), ":")
         if col:
-            s += str(col)
-            s += ":"
-        if s:
-            s += " "
-        s += str(message)
-        if s[-1] != "\n":
+            parts += (str(col), ":")
+        if parts:
+            parts.append(" ")
+        parts.append(str(message))
+        s = "".join(parts)
+        if not s.endswith("\n"):
             s += "\n"
         self._all.append(s)
         if self._stream:
@@ -249,6 +256,28 @@ class HostTools(object):
         return self._nsjail
 
 
+@functools.lru_cache(maxsize=None)
+def _host_tools():
+    """Return the HostTools, which are the same for every Context."""
+    return HostTools()
+
+
 def choose_out_dir():
     """Get the root of the out dir, either $OUT_DIR or a default."""
     return os.environ.get("OUT_DIR") or "out"
+
+
+# The directories that ensure_dir has already created.
+_ENSURED_DIRS = set()
+_ENSURED_DIRS_LOCK = threading.Lock()
+
+
+def ensure_dir(path):
+    """Create the directory path, if it has not already been done."""
+    path = os.path.abspath(path)
+    with _ENSURED_DIRS_LOCK:
+        if path in _ENSURED_DIRS:
+            return
+    os.makedirs(path, exist_ok=True)
+    with _ENSURED_DIRS_LOCK:
+        _ENSURED_DIRS.add(path)
@@ -16,12 +16,23 @@
 
 import argparse
 import contextlib
+import functools
 import json
 import os
 
+try:
+    import orjson
+    _json_loads = orjson.loads
+except ImportError:
+    _json_loads = json.loads
 
+
+@functools.lru_cache(maxsize=None)
 def _parser():
-    """Return the argument parser"""
+    """Return the argument parser.
+
+    The parser is only built once: parse_args does not modify it.
+    """
     # Top-level parser
     parser = argparse.ArgumentParser(prog=".inner_build")
 
@@ -101,8 +112,8 @@ class Commands(object):
     def describe(self, args):
         """Perform the default 'describe' processing."""
 
-        with open(args.input_json, encoding='iso-8859-1') as f:
-            query = json.load(f)
+        with open(args.input_json, "rb") as f:
+            query = _json_loads(f.read())
 
         # This version of describe() simply replies with the build_domains
         # requested.  If the inner tree can't build the requested build_domain,
@@ -110,7 +121,7 @@ class Commands(object):
         # what can be built, it should override this method with a method that
         # returns the appropriate information.
         # TODO: bazel-only builds will need to figure this out.
-        domain_data = [{"domains": [query.get("build_domains", [])]}]
+        domain_data = [{"domains": query.get("build_domains", [])}]
         reply = {"version": 0, "domain_data": domain_data}
 
         filename = args.output_json or os.path.join(args.out_dir,
@@ -0,0 +1,50 @@
+#!/usr/bin/env python3
+#
+# Copyright (C) 2022 The Android Open Source Project
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import json
+import os
+import tempfile
+import unittest
+
+from common import Commands
+
+
+class TestDescribe(unittest.TestCase):
+
+    def test_describe_returns_requested_domains(self):
+        with tempfile.TemporaryDirectory() as tmp:
+            query = os.path.join(tmp, "query.json")
+            reply = os.path.join(tmp, "tree_info.json")
+            # Written the way core/interrogate.py writes the query.
+            with open(query, "w", encoding="iso-8859-1") as f:
+                json.dump(dict(build_domains=["system", "vendor"]), f)
+            Commands().Run([
+                "inner_build", "--out_dir", tmp, "describe", "--input_json",
+                query, "--output_json", reply
+            ])
+            with open(reply, encoding="iso-8859-1") as f:
+                data = json.load(f)
+        self.assertEqual(
+            {
+                "version": 0,
+                "domain_data": [{
+                    "domains": ["system", "vendor"]
+                }]
+            }, data)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -14,8 +14,6 @@
 # See the License for the specific language governing permissions and
 # limitations under the License.
 
-import functools
-
 from ninja_syntax import Variable, BuildAction, Rule, Pool, Subninja, Line
 
 
@@ -26,19 +24,30 @@ class Writer:
     def __init__(self, file, builddir: str = None):
         self.file = file
         self.nodes = []  # type Node
+        self.build_actions = []  # type BuildAction
+        # The rules and build actions already added, so that adding the same
+        # one again is a no-op.  These belong to the writer, so they go away
+        # with it.
+        self._added_rules = set()
+        self._added_build_actions = set()
         if builddir:
             self.add_variable(Variable('builddir', builddir))
 
     def add_variable(self, variable: Variable):
         self.nodes.append(variable)
 
-    @functools.lru_cache(maxsize=None)
     def add_rule(self, rule: Rule):
+        if rule in self._added_rules:
+            return
+        self._added_rules.add(rule)
         self.nodes.append(rule)
 
-    @functools.lru_cache(maxsize=None)
     def add_build_action(self, build_action: BuildAction):
+        if build_action in self._added_build_actions:
+            return
+        self._added_build_actions.add(build_action)
         self.nodes.append(build_action)
+        self.build_actions.append(build_action)
 
     def add_pool(self, pool: Pool):
         self.nodes.append(pool)
@@ -59,6 +68,7 @@ class Writer:
         self.add_build_action(BuildAction(output=name, rule="phony", inputs=deps))
 
     def write(self):
-        for node in self.nodes:
-            for line in node.stream():
-                print(line, file=self.file)
+        # Build the whole file in memory, and write it with a single call.
+        lines = [line for node in self.nodes for line in node.stream()]
+        lines.append("")
+        self.file.write("\n".join(lines))
@@ -15,6 +15,7 @@
 # limitations under the License.
 
 import unittest
+import weakref
 
 from io import StringIO
 
@@ -45,6 +46,8 @@ class TestWriter(unittest.TestCase):
                                        rule="cc",
                                        inputs=["foo.c"])
             writer.add_build_action(build_action)
+            self.assertEqual(len(writer.build_actions), 2)
+            self.assertIs(writer.build_actions[1], build_action)
             writer.write()
             self.assertEqual(
                 '''cflags = -Wall
@@ -66,6 +69,14 @@ build foo.o: cc foo.c
             self.assertEqual("# This is a comment in a ninja file\n",
                              f.getvalue())
 
+    def test_writer_is_freed(self):
+        writer = Writer(None)
+        writer.add_rule(Rule(name="cc"))
+        writer.add_build_action(BuildAction(output="foo.o", rule="cc"))
+        ref = weakref.ref(writer)
+        del writer
+        self.assertIsNone(ref())
+
 
 if __name__ == "__main__":
     unittest.main()